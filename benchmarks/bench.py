@@ -0,0 +1,340 @@
+'''Benchmark Model load/save/delete, containers, validation and PromisePipeline.execute.
+
+Runs against an in-process fakeredis server by default, redis_mock with --backend mock,
+or a local Redis with --url. Results are printed and optionally written as JSON,
+which can be compared against a previous run.
+
+    $ python -m benchmarks.bench --output results.json
+    $ python -m benchmarks.bench --url redis://localhost:6379/15 --compare results.json
+    $ python -m benchmarks.bench --filter container --sizes 10 1000 100000
+'''
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+from datetime import datetime
+import redistil
+from redistil import Model, Field, String, Integer, Float, List, Set, PackedCodec, WriteBehind
+from redistil.pipeline import PromisePipeline
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# only run benchmarks whose name contains this string
+FILTER = None
+
+class Narrow(Model):
+    id = Field(String, primary_key=True)
+    integer = Field(Integer)
+    float = Field(Float)
+
+class NarrowSlots(Model):
+    class Meta:
+        slots = True
+
+    id = Field(String, primary_key=True)
+    integer = Field(Integer)
+    float = Field(Float)
+
+class NarrowCompact(Model):
+    class Meta:
+        slots = True
+        snapshots = False
+
+    id = Field(String, primary_key=True)
+    integer = Field(Integer)
+    float = Field(Float)
+
+class NarrowPacked(Model):
+    class Meta:
+        codec = PackedCodec()
+
+    id = Field(String, primary_key=True)
+    integer = Field(Integer)
+    float = Field(Float)
+
+# 30 fields
+Wide = type('Wide', (Model,), {
+    'id': Field(String, primary_key=True),
+    **{f'integer{i}': Field(Integer) for i in range(10)},
+    **{f'float{i}': Field(Float) for i in range(10)},
+    **{f'string{i}': Field(String) for i in range(9)},
+})
+
+class Containers(Model):
+    id = Field(String, primary_key=True)
+    list = List(String)
+    set = Set(Integer)
+
+
+class CommandCounter:
+    '''Wraps a Redis client and counts the commands sent, including those in pipelines.
+    '''
+    def __init__(self, db):
+        self.db = db
+        self.commands = 0
+
+    def pipeline(self, **kwargs):
+        pipeline = self.db.pipeline(**kwargs)
+        execute = pipeline.execute
+        def counted(*args, **kwargs):
+            self.commands += len(pipeline.command_stack)
+            return execute(*args, **kwargs)
+        pipeline.execute = counted
+        return pipeline
+
+    def __getattr__(self, name):
+        attr = getattr(self.db, name)
+        if not callable(attr):
+            return attr
+        def counted(*args, **kwargs):
+            self.commands += 1
+            return attr(*args, **kwargs)
+        return counted
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+def measure(name, db, fn, iterations, setup=None):
+    '''Run fn(i) iterations times, returning throughput, latency, command and allocation stats.
+    Allocations are measured in a separate pass as tracemalloc slows everything down.
+    '''
+    counter = CommandCounter(db)
+    if setup:
+        setup(counter)
+        counter.commands = 0
+    if FILTER and FILTER not in name:
+        return None
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn(counter, i)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    commands = counter.commands
+
+    samples = min(iterations, 20)
+    peaks = []
+    tracemalloc.start()
+    for i in range(samples):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(counter, i)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        'name': name,
+        'iterations': iterations,
+        'ops_per_sec': iterations / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'commands_per_op': commands / iterations,
+        'peak_bytes_per_op': sum(peaks) / len(peaks),
+    }
+
+
+def retained(name, db, fn, count):
+    '''Create count objects with fn(i) and keep them alive, returning the same stats as measure,
+    except that bytes/op is the memory retained by each object rather than the peak allocated.
+    '''
+    if FILTER and FILTER not in name:
+        return None
+    counter = CommandCounter(db)
+    latencies = []
+    start = time.perf_counter()
+    for i in range(count):
+        t = time.perf_counter()
+        fn(counter, i)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    commands = counter.commands
+
+    # measured as the memory freed by dropping the objects, which excludes anything the client
+    # or an in-process server keeps
+    tracemalloc.start()
+    objs = [fn(counter, i) for i in range(count)]
+    before = tracemalloc.get_traced_memory()[0]
+    del objs
+    size = before - tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return {
+        'name': name,
+        'iterations': count,
+        'ops_per_sec': count / elapsed,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'commands_per_op': commands / count,
+        'peak_bytes_per_op': size / count,
+    }
+
+
+def model_benchmarks(db, iterations):
+    def populate(model, count, **values):
+        def setup(db):
+            model.save_many(db, [model(id=str(i), **values) for i in range(count)])
+        return setup
+
+    wide_values = {
+        **{f'integer{i}': i for i in range(10)},
+        **{f'float{i}': i / 2 for i in range(10)},
+        **{f'string{i}': f'value {i}' for i in range(9)},
+    }
+    narrow_values = {'integer': 1, 'float': 1.5}
+    for model, values in ((Narrow, narrow_values), (NarrowPacked, narrow_values), (Wide, wide_values)):
+        name = model.__name__.lower()
+        selective = [model._fields[k] for k in list(values)[:2]]
+
+        yield measure(f'{name}.save', db, lambda db, i: model(id=str(i), **values).save(db), iterations)
+        yield measure(f'{name}.load', db, lambda db, i: model.load(db, str(i)), iterations,
+            populate(model, iterations, **values))
+        yield measure(f'{name}.load_selective', db, lambda db, i: model.load(db, str(i), *selective), iterations)
+        def update(db, i):
+            obj = model.load(db, str(i))
+            setattr(obj, selective[0].name, i + 1)
+            obj.save(db)
+        yield measure(f'{name}.load_update_save', db, update, iterations)
+        yield measure(f'{name}.load_many', db, lambda db, i: model.load_many(db, [str(x) for x in range(100)]),
+            max(1, iterations // 100))
+        if numpy:
+            yield measure(f'{name}.load_columns', db, lambda db, i: model.load_columns(db, [str(x) for x in range(100)], *selective),
+                max(1, iterations // 100))
+        yield measure(f'{name}.delete', db, lambda db, i: model(id=str(i)).delete(db), iterations)
+
+def container_benchmarks(db, iterations, sizes):
+    for size in sizes:
+        count = max(3, min(iterations, 100000 // size))
+        values = {'list': [str(x) for x in range(size)], 'set': set(range(size))}
+        yield measure(f'container[{size}].save', db, lambda db, i: Containers(id=str(i), **values).save(db), count)
+        yield measure(f'container[{size}].load', db, lambda db, i: Containers.load(db, str(i)), count)
+        def append(db, i):
+            obj = Containers.load(db, str(i))
+            obj.list.append('appended')
+            obj.set.add(-1)
+            obj.save(db)
+        yield measure(f'container[{size}].append_save', db, append, count)
+        Containers.delete_many(db, [Containers(id=str(i)) for i in range(count)])
+
+def memory_benchmarks(db, iterations):
+    # memory held by loaded objects, with and without Meta.slots and Meta.snapshots
+    for model in (Narrow, NarrowSlots, NarrowCompact):
+        model.save_many(db, [model(id=str(i), integer=i, float=i / 2) for i in range(iterations)])
+        name = model.__name__.lower()
+        yield retained(f'memory.{name}.load', db, lambda db, i: model.load(db, str(i)), iterations)
+        yield retained(f'memory.{name}.trusted', db, lambda db, i: model.trusted(id=str(i), integer=i, float=i / 2), iterations)
+        model.delete_many(db, [model(id=str(i)) for i in range(iterations)])
+
+def validation_benchmarks(db, iterations):
+    narrow = Narrow(id='abc', integer=1, float=1.5)
+    wide = Wide(id='abc', **{f'integer{i}': i for i in range(10)})
+    containers = Containers(id='abc', list=['a', 'b'], set={1, 2})
+    yield measure('validate.narrow', db, lambda db, i: narrow.validate(Narrow._schema.keys()), iterations * 10)
+    yield measure('validate.wide', db, lambda db, i: wide.validate(Wide._schema.keys()), iterations * 10)
+    yield measure('validate.containers', db, lambda db, i: containers.validate(Containers._schema.keys()), iterations * 10)
+
+def writer_benchmarks(db, iterations):
+    # 100 updates of 10 objects per iteration, which are coalesced into a single write
+    objs = [Narrow(id=str(i), integer=0, float=0.0) for i in range(10)]
+    def save(db, i):
+        for x in range(100):
+            for obj in objs:
+                obj.integer = x
+                obj.save(db)
+    def write_behind(db, i):
+        with WriteBehind(db, interval=60) as writer:
+            for x in range(100):
+                for obj in objs:
+                    obj.integer = x
+                    writer.save(obj)
+    yield measure('writer.save[1000]', db, save, max(1, iterations // 10))
+    yield measure('writer.write_behind[1000]', db, write_behind, max(1, iterations // 10))
+
+def pipeline_benchmarks(db, iterations):
+    db.hset('bench::hash', mapping={f'field{i}': i for i in range(100)})
+    def execute(db, i):
+        p = PromisePipeline(db)
+        for x in range(100):
+            p.hget('bench::hash', f'field{x}')
+        p.execute()
+    yield measure('pipeline.execute[100]', db, execute, iterations)
+    db.delete('bench::hash')
+
+
+def connect(args):
+    if args.url:
+        from redis import Redis
+        return Redis.from_url(args.url)
+    if args.backend == 'mock':
+        from redis_mock import Redis
+        return Redis()
+    from fakeredis import FakeRedis
+    return FakeRedis()
+
+def compare(results, path):
+    with open(path) as f:
+        previous = {r['name']: r for r in json.load(f)['results']}
+    print(f'\n{"benchmark":<36} {"ops/sec":>12} {"previous":>12} {"change":>8}')
+    for result in results:
+        old = previous.get(result['name'])
+        if old:
+            change = result['ops_per_sec'] / old['ops_per_sec'] - 1
+            print(f'{result["name"]:<36} {result["ops_per_sec"]:12.1f} {old["ops_per_sec"]:12.1f} {change:+8.1%}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Redis url, all keys are flushed')
+    parser.add_argument('--backend', choices=['fakeredis', 'mock'], default='fakeredis')
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000])
+    parser.add_argument('--filter', help='only run benchmarks whose name contains this string')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare against the results in this JSON file')
+    args = parser.parse_args()
+
+    global FILTER
+    FILTER = args.filter
+    db = connect(args)
+    db.flushdb()
+    suites = (
+        model_benchmarks(db, args.iterations),
+        container_benchmarks(db, args.iterations, args.sizes),
+        memory_benchmarks(db, args.iterations),
+        validation_benchmarks(db, args.iterations),
+        writer_benchmarks(db, args.iterations),
+        pipeline_benchmarks(db, args.iterations),
+    )
+
+    results = []
+    print(f'{"benchmark":<36} {"ops/sec":>12} {"p50 ms":>9} {"p99 ms":>9} {"cmds/op":>9} {"bytes/op":>11}')
+    for suite in suites:
+        for result in suite:
+            if result is None:
+                continue
+            results.append(result)
+            print(f'{result["name"]:<36} {result["ops_per_sec"]:12.1f} {result["p50_ms"]:9.3f} {result["p99_ms"]:9.3f} '
+                f'{result["commands_per_op"]:9.1f} {result["peak_bytes_per_op"]:11.0f}')
+    db.flushdb()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'redistil': redistil.__version__,
+                'python': sys.version,
+                'platform': platform.platform(),
+                'backend': args.url or args.backend,
+                'date': datetime.utcnow().isoformat(),
+                'results': results,
+            }, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+'''Compare the concurrency of AsyncModel against Model running in a thread pool.
+
+Runs against an in-process fakeredis server by default, or a local Redis with --url.
+
+    $ python -m benchmarks.bench_async --objects 2000 --concurrency 50
+    $ python -m benchmarks.bench_async --url redis://localhost:6379/15
+'''
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from redistil import Model, AsyncModel, Field, String, Integer, Float, List
+
+class SyncUser(Model):
+    id = Field(String, primary_key=True)
+    age = Field(Integer)
+    score = Field(Float)
+    tags = List(String)
+
+class AsyncUser(AsyncModel):
+    id = Field(String, primary_key=True)
+    age = Field(Integer)
+    score = Field(Float)
+    tags = List(String)
+
+    @classmethod
+    def key(cls, id):
+        # share the data written by SyncUser
+        return SyncUser.key(id)
+
+
+def connect(url):
+    if url:
+        from redis import Redis
+        from redis.asyncio import Redis as AsyncRedis
+        return Redis.from_url(url), AsyncRedis.from_url(url)
+    from fakeredis import FakeServer, FakeRedis, FakeAsyncRedis
+    server = FakeServer()
+    return FakeRedis(server=server), FakeAsyncRedis(server=server)
+
+def populate(db, count):
+    users = [SyncUser(id=str(i), age=i, score=i / 2, tags=['a', 'b', 'c']) for i in range(count)]
+    SyncUser.save_many(db, users)
+    return [user.id for user in users]
+
+def bench_sync(db, ids, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(lambda id: SyncUser.load(db, id), ids))
+    return time.perf_counter() - start
+
+async def bench_async(db, ids, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    async def load(id):
+        async with semaphore:
+            return await AsyncUser.load(db, id)
+    start = time.perf_counter()
+    await asyncio.gather(*[load(id) for id in ids])
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Redis url, defaults to an in-process fakeredis server')
+    parser.add_argument('--objects', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    db, async_db = connect(args.url)
+    ids = populate(db, args.objects)
+    try:
+        sync_time = bench_sync(db, ids, args.concurrency)
+        async_time = asyncio.run(bench_async(async_db, ids, args.concurrency))
+    finally:
+        SyncUser.delete_many(db, [SyncUser(id=id) for id in ids])
+
+    for name, elapsed in (('sync (threads)', sync_time), ('async', async_time)):
+        print(f'{name:>16}: {args.objects / elapsed:10.1f} loads/sec ({elapsed:.3f}s)')
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,14 @@
 from .redistil import *
 from .pipeline import *
+from .aio import *
+from .cache import *
+from .lazy import *
+from .instrumentation import *
+from .scripts import *
+from .codecs import *
+from .session import *
+from .dump import *
+from .writer import *
+from .router import *
 
 __version__ = '1.1.2'
@@ -0,0 +1,51 @@
+'''Dump and restore models.
+
+    $ python -m redistil dump myapp.models:User --output users.ndjson
+    $ python -m redistil dump myapp.models:User --format binary --output users.bin
+    $ python -m redistil --url redis://localhost:6379/1 restore myapp.models:User users.bin --checkpoint users.checkpoint
+'''
+import sys
+import argparse
+from importlib import import_module
+from redis import Redis
+from .dump import dump, restore
+
+def load_model(path):
+    '''Import a model given as module:Model or module.Model.
+    '''
+    module, _, name = path.rpartition(':') if ':' in path else path.rpartition('.')
+    return getattr(import_module(module), name)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m redistil', description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='redis://localhost:6379/0', help='Redis url')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    dump_parser = commands.add_parser('dump', help='write every object of a model to a file')
+    dump_parser.add_argument('model', help='module:Model')
+    dump_parser.add_argument('--output', help='file to write, defaults to stdout')
+    dump_parser.add_argument('--format', choices=['ndjson', 'binary'], default='ndjson')
+    dump_parser.add_argument('--batch', type=int, default=500, help='objects per SCAN and pipeline')
+
+    restore_parser = commands.add_parser('restore', help='write the objects in a dump')
+    restore_parser.add_argument('model', help='module:Model')
+    restore_parser.add_argument('input', help='file written by dump, in either format')
+    restore_parser.add_argument('--chunk-size', type=int, default=1000, help='objects per pipeline')
+    restore_parser.add_argument('--no-validate', dest='validate', action='store_false', help='skip validation')
+    restore_parser.add_argument('--checkpoint', help='file to record progress in, to resume an interrupted restore')
+
+    args = parser.parse_args(argv)
+    model = load_model(args.model)
+    db = Redis.from_url(args.url)
+    if args.command == 'dump':
+        if args.output:
+            with open(args.output, 'wb') as f:
+                count = dump(db, model, f, args.format, args.batch)
+        else:
+            count = dump(db, model, sys.stdout.buffer, args.format, args.batch)
+    else:
+        count = restore(db, model, args.input, args.chunk_size, args.validate, args.checkpoint)
+    print(f'{args.command} {count} {model.__name__} objects', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
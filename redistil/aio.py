@@ -0,0 +1,293 @@
+__all__ = ['AsyncModel']
+
+import asyncio
+from random import random
+from itertools import chain
+from redis.exceptions import WatchError
+from .redistil import Model, ConflictError, chunks, primary
+from .pipeline import AsyncPromisePipeline
+from .instrumentation import tracers, Span
+from .scripts import INCR
+
+async def retry_watched(write):
+    '''Await write until it completes without raising WatchError, see redistil.retry_watched.
+    '''
+    while True:
+        try:
+            return await write()
+        except WatchError:
+            pass
+
+async def execute_all(nodes):
+    '''Execute each node's pipelines in order, the nodes concurrently.
+    '''
+    async def execute(pipelines):
+        for p in pipelines:
+            await p.execute()
+    await asyncio.gather(*(execute(pipelines) for pipelines in nodes))
+
+class AsyncModel(Model):
+    '''Model for redis.asyncio clients.
+    Fields, types and validation are shared with Model, but any methods which
+    talk to Redis are coroutines.
+    '''
+    __slots__ = ()
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    async def create(cls, db, **values):
+        obj = cls(**values)
+        # assert that the primary key is set
+        if obj.id is None:
+            raise ValueError('Primary key not set')
+        await obj.save(db)
+        return obj
+
+    @classmethod
+    async def load(cls, db, id, *fields, include=(), depth=1):
+        # always load the primary key directly from the requested id
+        obj = cls(**{cls.primary_key(): id})
+        await obj.load_fields(db, *fields, include=include, depth=depth)
+        return obj
+
+    @classmethod
+    async def update(cls, db, id, fn, *fields, retries=5, backoff=0.01):
+        for attempt in range(retries + 1):
+            obj = await cls.load(db, id, *fields)
+            fn(obj)
+            try:
+                await obj.save(db, check_version=True)
+                return obj
+            except ConflictError:
+                obj._invalidate_cache()
+                if attempt == retries:
+                    raise
+            await asyncio.sleep(backoff * 2 ** attempt * random())
+
+    @classmethod
+    async def load_many(cls, db, ids, *fields, chunk_size=1000, include=(), depth=1):
+        objs = [cls(**{cls.primary_key(): id}) for id in ids]
+        result = []
+        for chunk in chunks(objs, chunk_size):
+            p = AsyncPromisePipeline(db)
+            queued = cls._queue_load_many(p, chunk, *fields)
+            await p.execute()
+            result.extend(cls._apply_load_many(chunk, queued))
+        if include:
+            await cls.load_references(db, result, include, depth)
+        return result
+
+    @classmethod
+    async def load_references(cls, db, objs, include=True, depth=1):
+        for _ in range(depth):
+            p = AsyncPromisePipeline(db)
+            queued = cls._queue_references(p, objs, include)
+            if not queued:
+                break
+            await p.execute()
+            objs = cls._apply_references(queued)
+
+    @classmethod
+    async def save_many(cls, db, objs, *fields, chunk_size=1000, ttl=None):
+        queued = cls._validate_many(objs, *fields)
+        for chunk in chunks(queued, chunk_size):
+            nodes, versions = await cls._write_many(db, chunk, ttl)
+            for (obj, field_names, data), version in zip(chunk, versions):
+                obj._mark_saved(field_names, version)
+
+    @classmethod
+    async def delete_many(cls, db, objs, chunk_size=1000):
+        for chunk in chunks(objs, chunk_size):
+            await cls._delete_many(db, chunk)
+            for obj in chunk:
+                obj._mark_deleted()
+
+    @classmethod
+    async def _write_many(cls, db, queued, ttl=None, span=None):
+        async def write():
+            p = AsyncPromisePipeline(db, transaction=True)
+            indexed = await cls._read_indexed(db, [(obj, field_names) for obj, field_names, data in queued], p)
+            if span:
+                span.mark('round_trip')
+            nodes, versions = cls._queue_save_many(db, [(*item, previous) for item, previous in zip(queued, indexed)], ttl, AsyncPromisePipeline, p)
+            if span:
+                span.mark('encode')
+            await execute_all(nodes)
+            if span:
+                span.mark('round_trip')
+            return nodes, versions
+        return await retry_watched(write)
+
+    @classmethod
+    async def _delete_many(cls, db, objs, span=None):
+        async def write():
+            p = AsyncPromisePipeline(db, transaction=True)
+            indexed = await cls._read_indexed(db, [(obj, obj._index_fields) for obj in objs], p)
+            for obj, previous in zip(objs, indexed):
+                obj._queue_delete(p, previous)
+            if span:
+                span.mark('encode')
+            await p.execute()
+            if span:
+                span.mark('round_trip')
+            return p
+        return await retry_watched(write)
+
+    @classmethod
+    async def find_ids(cls, db, **values):
+        p = AsyncPromisePipeline(db)
+        results = cls._queue_find_ids(p, **values)
+        await p.execute()
+        return cls._apply_find_ids(results)
+
+    @classmethod
+    async def find_by(cls, db, *fields, **values):
+        ids = await cls.find_ids(db, **values)
+        return [obj for obj in await cls.load_many(db, ids, *fields) if obj is not None]
+
+    @classmethod
+    async def range_ids(cls, db, field, lo=None, hi=None, limit=None, offset=0):
+        args, kwargs = cls._range_args(field, lo, hi, limit, offset)
+        return cls._index_ids(await db.zrangebyscore(*args, **kwargs))
+
+    @classmethod
+    async def range(cls, db, field, lo=None, hi=None, *fields, limit=None, offset=0):
+        ids = await cls.range_ids(db, field, lo, hi, limit=limit, offset=offset)
+        return [obj for obj in await cls.load_many(db, ids, *fields) if obj is not None]
+
+    @classmethod
+    async def iter_ids(cls, db, batch=500):
+        async for key in db.scan_iter(match=cls.key_prefix() + '*', count=batch):
+            id = cls._key_id(key)
+            if id is not None:
+                yield id
+
+    @classmethod
+    async def iter_all(cls, db, *fields, batch=500, ids_only=False):
+        chunk = []
+        async for id in cls.iter_ids(db, batch):
+            if ids_only:
+                yield id
+                continue
+            chunk.append(id)
+            if len(chunk) >= batch:
+                for obj in await cls.load_many(db, chunk, *fields, chunk_size=batch):
+                    if obj is not None:
+                        yield obj
+                chunk = []
+        if chunk:
+            for obj in await cls.load_many(db, chunk, *fields, chunk_size=batch):
+                if obj is not None:
+                    yield obj
+
+    @classmethod
+    async def _read_indexed(cls, db, queued, watch=None):
+        p = AsyncPromisePipeline(primary(db))
+        reads = [obj._queue_indexed(p, field_names) for obj, field_names in queued]
+        if any(reads):
+            keys = [obj.redis_key for (obj, _), read in zip(queued, reads) if read and not obj._meta.get('hash_tags')]
+            if watch is not None and keys:
+                await watch.watch(*keys)
+            await p.execute()
+        return [obj._apply_indexed(read) for (obj, _), read in zip(queued, reads)]
+
+    async def load_fields(self, db, *fields, include=(), depth=1):
+        field_names = self._load_field_names(*fields)
+        cache = self._meta.get('cache')
+        if cache is not None:
+            token = cache.token()
+            if self._load_cached(cache, field_names):
+                p = AsyncPromisePipeline(db, transaction=False)
+                self._queue_refresh(p)
+                if p.commands:
+                    await p.execute()
+                if include:
+                    await self.load_references(db, [self], include, depth)
+                return
+
+        span = Span('load_fields', self.__class__, field_names) if tracers else None
+
+        p = AsyncPromisePipeline(db)
+        values = self._queue_load(p, field_names)
+        if span:
+            span.mark('encode')
+        await p.execute()
+        if span:
+            span.mark('round_trip')
+        values = self._apply_load(values)
+        if span:
+            span.mark('decode')
+            span.finish(p)
+
+        if cache is not None and self._persisted:
+            cache.set(self.redis_key, field_names, values, token)
+        if include:
+            await self.load_references(db, [self], include, depth)
+
+    async def save(self, db, *fields, check_version=False, ttl=None):
+        field_names = self._save_field_names(*fields)
+        if not field_names:
+            return
+        if check_version:
+            version_field = self._get_version_check()
+            if not await self.save_if(db, version_field, self._data.get(version_field.name), *fields, ttl=ttl):
+                raise ConflictError(f'{self.redis_key} has been modified')
+            return
+
+        span = Span('save', self.__class__, field_names) if tracers else None
+
+        # normalise and validate
+        data = self.validate(field_names)
+        if span:
+            span.mark('validate')
+        nodes, versions = await self._write_many(db, [(self, field_names, data)], ttl, span)
+        self._mark_saved(field_names, versions[0])
+        if span:
+            span.finish(*chain.from_iterable(nodes))
+
+    async def delete(self, db):
+        span = Span('delete', self.__class__) if tracers else None
+        p = await self._delete_many(db, [self], span)
+        self._mark_deleted()
+        if span:
+            span.finish(p)
+
+    async def incr(self, db, field, amount=1):
+        keys, args = self._queue_incr(field, amount)
+        value = self._apply_incr(field, await INCR.call_async(db, keys, args))
+        if self._meta.get('hash_tags') and field.name in self._index_fields:
+            await field.add_index(db, self._db_id, value)
+        return value
+
+    async def compare_and_set(self, db, field, expected, value):
+        saved, version = False, None
+        restore = self._data.get(field.name), field.name in (self._dirty or ())
+        try:
+            setattr(self, field.name, value)
+            commands, version, index = self._queue_compare_and_set(field, expected)
+            saved = await commands.execute_async(db)
+            if saved:
+                await self._write_index(db, index)
+        finally:
+            self._apply_compare_and_set(field, saved, restore, version)
+        return saved
+
+    async def save_if(self, db, field, expected, *fields, ttl=None):
+        field_names = self._save_field_names(*fields)
+        data = self.validate(field_names)
+        previous = (await self._read_indexed(db, [(self, field_names)]))[0]
+        commands, version, index = self._queue_if_equal(field, expected, data, field_names, previous, ttl)
+        if not await commands.execute_async(db):
+            return False
+        await self._write_index(db, index)
+        self._mark_saved(field_names, version)
+        return True
+
+    async def _write_index(self, db, index):
+        if index:
+            p = AsyncPromisePipeline(db)
+            self._queue_index(p, *index)
+            if p.commands:
+                await p.execute()
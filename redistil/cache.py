@@ -0,0 +1,175 @@
+__all__ = ['ObjectCache']
+
+import sys
+import time
+from copy import copy
+from threading import Lock
+from collections import OrderedDict, namedtuple
+from .redistil import Model
+
+# referenced objects are cached as their model and id, so state isn't shared between cache hits
+CachedReference = namedtuple('CachedReference', ('model', 'id'))
+
+def to_cache(value):
+    if isinstance(value, Model):
+        return CachedReference(type(value), value.id)
+    if isinstance(value, list):
+        return [to_cache(x) for x in value]
+    if isinstance(value, set):
+        return {to_cache(x) for x in value}
+    return copy(value)
+
+def from_cache(value):
+    if isinstance(value, CachedReference):
+        return value.model.trusted(**{value.model.primary_key(): value.id})
+    if isinstance(value, list):
+        return [from_cache(x) for x in value]
+    if isinstance(value, set):
+        return {from_cache(x) for x in value}
+    return copy(value)
+
+def estimate_size(values):
+    size = sys.getsizeof(values)
+    for value in values.values():
+        size += sys.getsizeof(value)
+        if isinstance(value, (list, set)):
+            size += sum(sys.getsizeof(x) for x in value)
+    return size
+
+
+class ObjectCache:
+    '''In-process read-through cache for Model.load and Model.load_fields.
+    Enable it for a model by setting Meta.cache to an ObjectCache.
+
+    Entries are keyed by the object's redis key and the set of loaded fields.
+    They are evicted in LRU order once there are more than maxsize entries or
+    the estimated size exceeds max_bytes, and expire after ttl seconds.
+    Saving or deleting an object invalidates its entries, writes made by other
+    processes can be evicted by calling listen.
+    '''
+    def __init__(self, maxsize=1024, ttl=None, max_bytes=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = Lock()
+        # (key, field_names) -> (expires, size, values)
+        self.entries = OrderedDict()
+        # key -> set of (key, field_names)
+        self.keys = {}
+        self.bytes = 0
+        # incremented on every invalidation, used to discard loads that raced with a write
+        self.invalidations = 0
+        self.hits = 0
+        self.misses = 0
+        self.listeners = []
+
+    def __len__(self):
+        return len(self.entries)
+
+    def token(self):
+        return self.invalidations
+
+    def get(self, key, field_names):
+        entry_key = (key, frozenset(field_names))
+        with self.lock:
+            entry = self.entries.get(entry_key)
+            if entry is not None and entry[0] is not None and entry[0] < time.monotonic():
+                self._remove(entry_key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(entry_key)
+            # copy so modifications to one object don't leak into the cache
+            return {k: from_cache(v) for k, v in entry[2].items()}
+
+    def set(self, key, field_names, values, token):
+        entry_key = (key, frozenset(field_names))
+        values = {k: to_cache(v) for k, v in values.items()}
+        size = estimate_size(values)
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self.lock:
+            # the object was written while we were loading it
+            if token != self.invalidations:
+                return
+            if entry_key in self.entries:
+                self._remove(entry_key)
+            self.entries[entry_key] = (expires, size, values)
+            self.keys.setdefault(key, set()).add(entry_key)
+            self.bytes += size
+            while self.entries and (len(self.entries) > self.maxsize or (self.max_bytes and self.bytes > self.max_bytes)):
+                self._remove(next(iter(self.entries)))
+
+    def invalidate(self, key):
+        with self.lock:
+            self.invalidations += 1
+            for entry_key in list(self.keys.get(key, ())):
+                self._remove(entry_key)
+
+    def clear(self):
+        with self.lock:
+            self.invalidations += 1
+            self.entries.clear()
+            self.keys.clear()
+            self.bytes = 0
+
+    def _remove(self, entry_key):
+        _, size, _ = self.entries.pop(entry_key)
+        self.bytes -= size
+        keys = self.keys[entry_key[0]]
+        keys.discard(entry_key)
+        if not keys:
+            del self.keys[entry_key[0]]
+
+    def _invalidate_redis_key(self, key):
+        key = key.decode('utf-8') if isinstance(key, bytes) else key
+        # container keys are suffixed to the object's key
+        self.invalidate(key)
+        self.invalidate(key.rsplit('::', 1)[0])
+
+    def listen(self, db, *models, tracking=False, sleep_time=1.0):
+        '''Evict entries when other clients write to the models' keys.
+        By default this subscribes to keyspace notifications, which must be enabled
+        on the server (ie. notify-keyspace-events 'Kghlsxe').
+        With tracking=True client side caching in broadcast mode is used instead,
+        which requires Redis 6 or newer.
+        Returns the listener thread, call stop to end all listeners.
+        '''
+        prefixes = [model.key_prefix() for model in models]
+        pubsub = db.pubsub(ignore_subscribe_messages=True)
+
+        if tracking:
+            # the tracking connection redirects invalidation messages to the pubsub connection
+            pubsub.execute_command('CLIENT', 'ID')
+            client_id = pubsub.parse_response()
+            def handler(message):
+                if message['data'] is None:
+                    self.clear()
+                    return
+                for key in message['data']:
+                    self._invalidate_redis_key(key)
+            pubsub.subscribe(**{'__redis__:invalidate': handler})
+            tracker = db.client()
+            tracker.client_tracking_on(clientid=client_id, prefix=prefixes, bcast=True)
+        else:
+            channel = f'__keyspace@{db.connection_pool.connection_kwargs.get("db", 0)}__:'
+            def handler(message):
+                self._invalidate_redis_key(message['channel'][len(channel):])
+            pubsub.psubscribe(**{f'{channel}{prefix}*': handler for prefix in prefixes})
+            tracker = None
+
+        thread = pubsub.run_in_thread(sleep_time=sleep_time, daemon=True)
+        self.listeners.append((thread, tracker))
+        return thread
+
+    def stop(self):
+        for thread, tracker in self.listeners:
+            thread.stop()
+            if tracker is not None:
+                tracker.client_tracking_off()
+                tracker.close()
+        self.listeners = []
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.entries), 'bytes': self.bytes}
@@ -0,0 +1,175 @@
+__all__ = ['Codec', 'TextCodec', 'PackedCodec', 'CompressedCodec', 'Blob', 'MsgpackBlob']
+
+import zlib
+import lzma
+from struct import Struct
+from datetime import date, datetime, timedelta, timezone
+from ipaddress import ip_address, IPv4Address, IPv6Address
+
+class Codec:
+    '''Converts field values to and from the values stored in Redis.
+    Set per field with Field(..., codec=...) or per model with Meta.codec.
+    encoder and decoder are called once per field, so they should return the
+    conversion functions rather than dispatching on each value.
+    '''
+    def encoder(self, type):
+        raise NotImplementedError
+
+    def decoder(self, type):
+        raise NotImplementedError
+
+
+class TextCodec(Codec):
+    '''The default, uses the type's to_db and from_db which store values as text.
+    '''
+    def encoder(self, type):
+        return type.to_db
+
+    def decoder(self, type):
+        return type.from_db
+
+
+INT64 = Struct('>q')
+INT32 = Struct('>i')
+DOUBLE = Struct('>d')
+# microseconds since the epoch and the utc offset in seconds for aware datetimes
+DATETIME_AWARE = Struct('>qi')
+EPOCH = datetime(1970, 1, 1)
+EPOCH_UTC = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+
+def pack_datetime(value):
+    if value.tzinfo is None:
+        return INT64.pack((value - EPOCH) // MICROSECOND)
+    offset = value.utcoffset()
+    return DATETIME_AWARE.pack((value - EPOCH_UTC) // MICROSECOND, offset // timedelta(seconds=1))
+
+def unpack_datetime(value):
+    if len(value) == INT64.size:
+        return EPOCH + INT64.unpack(value)[0] * MICROSECOND
+    micros, offset = DATETIME_AWARE.unpack(value)
+    return (EPOCH_UTC + micros * MICROSECOND).astimezone(timezone(timedelta(seconds=offset)))
+
+
+class PackedCodec(TextCodec):
+    '''Fixed width binary encodings, which are smaller and faster to decode than text.
+    Integers are signed 64 bit, Floats and Numbers are doubles, Dates are 32 bit ordinals,
+    DateTimes are 64 bit microseconds since the epoch, IP addresses are their 4 or 16 bytes.
+    Other types fall back to text.
+    Keys, indexes and Model.incr always use text, so incr can't be used with packed fields.
+    '''
+    # schema type -> (encode, decode)
+    codecs = {
+        'boolean': (lambda value: b'\x01' if value else b'\x00', lambda value: value == b'\x01'),
+        'integer': (INT64.pack, lambda value: INT64.unpack(value)[0]),
+        'float': (lambda value: DOUBLE.pack(value), lambda value: DOUBLE.unpack(value)[0]),
+        'number': (lambda value: DOUBLE.pack(value), lambda value: DOUBLE.unpack(value)[0]),
+        'date': (lambda value: INT32.pack(value.toordinal()), lambda value: date.fromordinal(INT32.unpack(value)[0])),
+        'datetime': (pack_datetime, unpack_datetime),
+        'ipaddress': (lambda value: value.packed, ip_address),
+        'ipv4address': (lambda value: value.packed, IPv4Address),
+        'ipv6address': (lambda value: value.packed, IPv6Address),
+    }
+
+    def encoder(self, type):
+        codec = self.codecs.get(type.schema['type'])
+        return codec[0] if codec else super().encoder(type)
+
+    def decoder(self, type):
+        codec = self.codecs.get(type.schema['type'])
+        return codec[1] if codec else super().decoder(type)
+
+
+def to_bytes(value):
+    # the same conversions redis-py makes when sending values
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, str):
+        return value.encode('utf-8')
+    if isinstance(value, float):
+        return repr(value).encode('utf-8')
+    return str(value).encode('utf-8')
+
+
+# algorithm -> (header, compress, decompress)
+COMPRESSORS = {
+    'zlib': (b'\x01', zlib.compress, zlib.decompress),
+    'lzma': (b'\x02', lzma.compress, lzma.decompress),
+}
+UNCOMPRESSED = b'\x00'
+
+class CompressedCodec(Codec):
+    '''Wraps another codec, compressing encoded values of at least threshold bytes.
+    Created by Field(..., compress='zlib'|'lzma', threshold=1024).
+    Every value is prefixed with a header byte saying how it was compressed, so values written
+    before compression was enabled can't be read, but the algorithm can be changed.
+    '''
+    def __init__(self, codec, algorithm='zlib', threshold=1024):
+        if algorithm not in COMPRESSORS:
+            raise ValueError(f'Unknown compression algorithm {algorithm}')
+        self.codec = codec
+        self.algorithm = algorithm
+        self.threshold = threshold
+        # measured as values are written
+        self.values = 0
+        self.compressed = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def encoder(self, type):
+        encode = self.codec.encoder(type)
+        header, compress, _ = COMPRESSORS[self.algorithm]
+        def compressed(value):
+            value = to_bytes(encode(value))
+            self.values += 1
+            self.raw_bytes += len(value)
+            if len(value) >= self.threshold:
+                self.compressed += 1
+                value = header + compress(value)
+            else:
+                value = UNCOMPRESSED + value
+            self.stored_bytes += len(value)
+            return value
+        return compressed
+
+    def decoder(self, type):
+        decode = self.codec.decoder(type)
+        decompressors = {header: decompress for header, _, decompress in COMPRESSORS.values()}
+        def decompressed(value):
+            header, value = value[:1], value[1:]
+            if header != UNCOMPRESSED:
+                value = decompressors[header](value)
+            return decode(value)
+        return decompressed
+
+    def stats(self):
+        ratio = self.stored_bytes / self.raw_bytes if self.raw_bytes else None
+        return {'values': self.values, 'compressed': self.compressed,
+            'raw_bytes': self.raw_bytes, 'stored_bytes': self.stored_bytes, 'ratio': ratio}
+
+
+class Blob:
+    '''Stores every hash field of an object in a single string value rather than a hash.
+    Set with Meta.blob. Values are encoded by the fields' codecs before being serialized.
+    '''
+    def dumps(self, mapping):
+        raise NotImplementedError
+
+    def loads(self, value):
+        raise NotImplementedError
+
+
+class MsgpackBlob(Blob):
+    '''Serializes the hash fields with msgpack.
+    Requires the msgpack package.
+    '''
+    def __init__(self):
+        import msgpack
+        self.msgpack = msgpack
+
+    def dumps(self, mapping):
+        # values are stored as bytes so they decode exactly as they would from a hash
+        return self.msgpack.packb({k: to_bytes(v) for k, v in mapping.items()}, use_bin_type=True)
+
+    def loads(self, value):
+        return self.msgpack.unpackb(value, raw=False)
@@ -0,0 +1,65 @@
+'''Vectorized decoding of columns of stored values for Model.load_columns.
+Requires numpy, which is only imported when load_columns is used.
+'''
+import warnings
+import numpy
+from .codecs import TextCodec, PackedCodec, INT32
+
+# date.toordinal() of the epoch
+EPOCH_ORDINAL = 719163
+
+def decode_text(kind, values):
+    values = numpy.array(values, dtype=bytes)
+    if kind == 'integer':
+        return values.astype(numpy.int64)
+    if kind in ('float', 'number'):
+        return values.astype(numpy.float64)
+    if kind == 'boolean':
+        return values.astype(numpy.int64).astype(bool)
+    if kind == 'date':
+        return values.astype(str).astype('datetime64[D]')
+    if kind == 'datetime':
+        # numpy warns about timezones, leave aware datetimes to the per value fallback
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            return values.astype(str).astype('datetime64[us]')
+
+def decode_packed(kind, values):
+    if kind == 'integer':
+        return numpy.frombuffer(b''.join(values), dtype='>i8').astype(numpy.int64)
+    if kind in ('float', 'number'):
+        return numpy.frombuffer(b''.join(values), dtype='>f8').astype(numpy.float64)
+    if kind == 'boolean':
+        return numpy.frombuffer(b''.join(values), dtype=numpy.uint8).astype(bool)
+    if kind == 'date':
+        return (numpy.frombuffer(b''.join(values), dtype='>i4') - EPOCH_ORDINAL).astype('datetime64[D]')
+    if kind == 'datetime' and all(len(value) == 8 for value in values):
+        return numpy.frombuffer(b''.join(values), dtype='>i8').astype('datetime64[us]')
+
+# placeholders for missing values, which are masked afterwards
+TEXT_MISSING = {'integer': b'0', 'float': b'nan', 'number': b'nan', 'boolean': b'0', 'date': b'1970-01-01', 'datetime': b'1970-01-01T00:00:00'}
+PACKED_MISSING = {'integer': bytes(8), 'float': bytes(8), 'number': bytes(8), 'boolean': bytes(1), 'date': INT32.pack(EPOCH_ORDINAL), 'datetime': bytes(8)}
+
+def decode_column(field, values):
+    '''Decode the stored values of a field, None for missing values.
+    Integers, Floats, Numbers, Booleans, Dates and DateTimes stored as text or packed are decoded
+    in a single numpy conversion, with missing values masked. Other values are decoded one at a time
+    into an object array, with None for missing values.
+    '''
+    kind = field.type.schema['type']
+    codec = type(field.resolved_codec)
+    missing = [value is None for value in values]
+    column = None
+    try:
+        if codec is TextCodec and kind in TEXT_MISSING:
+            column = decode_text(kind, [TEXT_MISSING[kind] if value is None else value for value in values])
+        elif codec is PackedCodec and kind in PACKED_MISSING:
+            column = decode_packed(kind, [PACKED_MISSING[kind] if value is None else value for value in values])
+    except (ValueError, Warning):
+        column = None
+
+    if column is None:
+        return numpy.array([None if value is None else field.from_db(value) for value in values], dtype=object)
+    if any(missing):
+        return numpy.ma.masked_array(column, mask=missing)
+    return column
@@ -0,0 +1,180 @@
+'''Stream objects to and from files.
+
+Objects are dumped as their stored values, so any codec or compression round trips exactly,
+either as NDJSON or a compact length-prefixed binary format.
+
+NDJSON has an object per line, mapping field names to stored values. Values are strings,
+or {"base64": ...} if they aren't valid UTF-8, containers are lists of values.
+
+The binary format starts with MAGIC, followed by a record per object:
+    record: u32 length, u16 number of fields, then each field
+    field: u16 name length, name, u8 kind (0 hash value, 1 list, 2 set), u32 number of values, then each value
+    value: u32 length, bytes
+'''
+__all__ = ['dump', 'restore']
+
+import os
+import json
+import mmap
+from base64 import b64encode, b64decode
+from struct import Struct
+from .redistil import List, Set, chunks
+from .pipeline import PromisePipeline
+
+MAGIC = b'REDISTIL\x01\n'
+U8 = Struct('>B')
+U16 = Struct('>H')
+U32 = Struct('>I')
+HASH, LIST, SET = 0, 1, 2
+
+def dump(db, model, file, format='ndjson', batch=500):
+    '''Write every object of model to file, a binary file object, as 'ndjson' or 'binary'.
+    Ids are found with SCAN, then each batch of objects and their containers is read in one pipeline.
+    Returns the number of objects written.
+    '''
+    write = {'ndjson': write_ndjson, 'binary': write_binary}[format]
+    if format == 'binary':
+        file.write(MAGIC)
+    count = 0
+    for ids in chunks(model.iter_ids(db, batch), batch):
+        for record in read_records(db, model, ids):
+            file.write(write(model, record))
+            count += 1
+    return count
+
+def read_records(db, model, ids):
+    '''Returns the stored values of each object, skipping objects deleted since they were scanned.
+    '''
+    hash_names = [name for name in model._fields if name in model._hash_fields]
+    containers = [name for name in model._fields if name not in model._hash_fields]
+    p = PromisePipeline(db, transaction=False)
+    queued = []
+    for id in ids:
+        key = model(**{model.primary_key(): id}).redis_key
+        hash_values = model._queue_hash(p, key, hash_names)
+        queued.append((hash_values, {name: model._fields[name].load(p, key, name) for name in containers}))
+    p.execute()
+    records = []
+    for hash_values, container_values in queued:
+        if not hash_values.value:
+            continue
+        record = model._hash_values(hash_names, hash_values.value)
+        record.update({name: promise.value for name, promise in container_values.items() if promise.value})
+        records.append({k: v for k, v in record.items() if v is not None})
+    return records
+
+def to_json(value):
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return {'base64': b64encode(value).decode('ascii')}
+
+def from_json(value):
+    if isinstance(value, dict):
+        return b64decode(value['base64'])
+    return value.encode('utf-8')
+
+def write_ndjson(model, record):
+    record = {k: [to_json(x) for x in v] if isinstance(v, (list, set)) else to_json(v) for k, v in record.items()}
+    return json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n'
+
+def write_binary(model, record):
+    def kind(name):
+        field = model._fields[name]
+        return LIST if isinstance(field, List) else SET if isinstance(field, Set) else HASH
+    parts = [U16.pack(len(record))]
+    for name, value in record.items():
+        kind_ = kind(name)
+        values = [value] if kind_ == HASH else value
+        name = name.encode('utf-8')
+        parts += [U16.pack(len(name)), name, U8.pack(kind_), U32.pack(len(values))]
+        for value in values:
+            parts += [U32.pack(len(value)), value]
+    payload = b''.join(parts)
+    return U32.pack(len(payload)) + payload
+
+def iter_ndjson(data, offset):
+    '''Yields each record and the offset of the next one.
+    '''
+    while offset < len(data):
+        end = data.find(b'\n', offset)
+        end = len(data) if end == -1 else end
+        line = data[offset:end]
+        offset = end + 1
+        if line.strip():
+            record = json.loads(line)
+            yield {k: [from_json(x) for x in v] if isinstance(v, list) else from_json(v) for k, v in record.items()}, offset
+
+def iter_binary(data, offset):
+    offset = max(offset, len(MAGIC))
+    while offset < len(data):
+        length, = U32.unpack_from(data, offset)
+        start = offset = offset + U32.size
+        record = {}
+        count, = U16.unpack_from(data, offset)
+        offset += U16.size
+        for _ in range(count):
+            size, = U16.unpack_from(data, offset)
+            name = data[offset + U16.size:offset + U16.size + size].decode('utf-8')
+            offset += U16.size + size
+            kind, = U8.unpack_from(data, offset)
+            n, = U32.unpack_from(data, offset + U8.size)
+            offset += U8.size + U32.size
+            values = []
+            for _ in range(n):
+                size, = U32.unpack_from(data, offset)
+                values.append(data[offset + U32.size:offset + U32.size + size])
+                offset += U32.size + size
+            record[name] = values[0] if kind == HASH else values
+        offset = start + length
+        yield record, offset
+
+def restore(db, model, path, chunk_size=1000, validate=True, checkpoint=None):
+    '''Write the objects in the file at path, dumped as either format, in non-transactional
+    pipelines of chunk_size objects. The file is memory mapped rather than read into memory.
+    Objects are decoded and, unless validate is False, validated before being written.
+    Index entries are added, but entries for the previous values of existing objects aren't removed.
+    If checkpoint is a path, the offset of the next object is written to it after each chunk
+    so an interrupted restore continues where it stopped. It is removed once the restore completes.
+    Returns the number of objects written.
+    '''
+    offset = 0
+    if checkpoint and os.path.exists(checkpoint):
+        with open(checkpoint) as f:
+            offset = int(f.read())
+
+    count = 0
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return count
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            records = iter_binary(data, offset) if data[:len(MAGIC)] == MAGIC else iter_ndjson(data, offset)
+            for chunk in chunks(records, chunk_size):
+                p = PromisePipeline(db, transaction=False)
+                for record, _ in chunk:
+                    queue_restore(p, model, record, validate)
+                p.execute()
+                count += len(chunk)
+                if checkpoint:
+                    write_checkpoint(checkpoint, chunk[-1][1])
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return count
+
+def queue_restore(p, model, record, validate):
+    values = {k: model._fields[k].from_db(v) for k, v in record.items() if k in model._fields}
+    obj = model()
+    obj._data.update(values)
+    data = obj.validate(values.keys()) if validate else values
+    obj._queue_save(p, data, values.keys(), {})
+    # the version is incremented when saving, so restore the dumped value afterwards
+    version_field = model._version_field
+    if version_field in record:
+        p.hset(obj.redis_key, version_field, record[version_field])
+
+def write_checkpoint(path, offset):
+    # replace the file so an interruption never leaves it partially written
+    temp = f'{path}.tmp'
+    with open(temp, 'w') as f:
+        f.write(str(offset))
+    os.replace(temp, path)
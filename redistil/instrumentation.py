@@ -0,0 +1,138 @@
+__all__ = ['Event', 'Tracer', 'StatsTracer', 'PrometheusTracer', 'add_tracer', 'remove_tracer']
+
+from time import perf_counter
+from threading import Lock
+
+# registered tracers, instrumented code checks this before doing any work
+# so there is no overhead when it is empty
+tracers = []
+
+def add_tracer(tracer):
+    tracers.append(tracer)
+
+def remove_tracer(tracer):
+    tracers.remove(tracer)
+
+def payload_size(value):
+    '''Approximate number of bytes sent or received for a value.
+    '''
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(payload_size(k) + payload_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sum(payload_size(x) for x in value)
+    if value is None:
+        return 0
+    return len(str(value))
+
+
+class Event:
+    '''An instrumented operation.
+    operation is one of 'execute', 'load_fields', 'save', 'validate' or 'delete'.
+    model is the Model class and fields the names of the fields involved, execute events have neither.
+    timings are in seconds, keyed by phase ('validate', 'encode', 'round_trip', 'decode') and 'total'.
+    '''
+    def __init__(self, operation, model=None, fields=()):
+        self.operation = operation
+        self.model = model
+        self.fields = frozenset(fields)
+        self.commands = 0
+        self.request_bytes = 0
+        self.reply_bytes = 0
+        self.timings = {}
+
+    @property
+    def model_name(self):
+        return self.model.__name__ if self.model is not None else ''
+
+    def __repr__(self):
+        return (f'Event({self.operation!r}, model={self.model_name!r}, commands={self.commands}, '
+            f'request_bytes={self.request_bytes}, reply_bytes={self.reply_bytes}, timings={self.timings})')
+
+
+class Span:
+    '''Times the phases of an operation and notifies tracers.
+    Only create a Span if tracers is not empty.
+    '''
+    def __init__(self, operation, model=None, fields=()):
+        self.event = Event(operation, model, fields)
+        self.start = self.last = perf_counter()
+        for tracer in tracers:
+            tracer.before(self.event)
+
+    def mark(self, phase):
+        '''Attribute the time since the previous mark to phase.
+        '''
+        now = perf_counter()
+        self.event.timings[phase] = self.event.timings.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def finish(self, *pipelines):
+        event = self.event
+        for p in pipelines:
+            event.commands += p.commands
+            event.request_bytes += p.request_bytes
+            event.reply_bytes += p.reply_bytes
+        event.timings['total'] = perf_counter() - self.start
+        for tracer in tracers:
+            tracer.after(event)
+        return event
+
+
+class Tracer:
+    '''Base class for tracers, register them with add_tracer.
+    '''
+    def before(self, event):
+        pass
+
+    def after(self, event):
+        pass
+
+
+class StatsTracer(Tracer):
+    '''Aggregates events in-process by operation and model.
+    '''
+    def __init__(self):
+        self.lock = Lock()
+        self.stats = {}
+
+    def after(self, event):
+        key = (event.operation, event.model_name)
+        with self.lock:
+            stats = self.stats.setdefault(key, {'count': 0, 'commands': 0, 'request_bytes': 0, 'reply_bytes': 0, 'timings': {}})
+            stats['count'] += 1
+            stats['commands'] += event.commands
+            stats['request_bytes'] += event.request_bytes
+            stats['reply_bytes'] += event.reply_bytes
+            for phase, elapsed in event.timings.items():
+                stats['timings'][phase] = stats['timings'].get(phase, 0.0) + elapsed
+
+    def reset(self):
+        with self.lock:
+            self.stats = {}
+
+
+class PrometheusTracer(Tracer):
+    '''Exports events as Prometheus counters and histograms.
+    Requires the prometheus_client package.
+    '''
+    def __init__(self, registry=None, prefix='redistil', buckets=None):
+        from prometheus_client import Counter, Histogram, REGISTRY
+        registry = registry or REGISTRY
+        labels = ['operation', 'model']
+        histogram = {'buckets': buckets} if buckets else {}
+        self.operations = Counter(f'{prefix}_operations', 'Instrumented operations', labels, registry=registry)
+        self.commands = Counter(f'{prefix}_commands', 'Redis commands sent', labels, registry=registry)
+        self.request_bytes = Counter(f'{prefix}_request_bytes', 'Approximate bytes sent to Redis', labels, registry=registry)
+        self.reply_bytes = Counter(f'{prefix}_reply_bytes', 'Approximate bytes received from Redis', labels, registry=registry)
+        self.seconds = Histogram(f'{prefix}_operation_seconds', 'Operation time by phase', labels + ['phase'], registry=registry, **histogram)
+
+    def after(self, event):
+        labels = (event.operation, event.model_name)
+        self.operations.labels(*labels).inc()
+        self.commands.labels(*labels).inc(event.commands)
+        self.request_bytes.labels(*labels).inc(event.request_bytes)
+        self.reply_bytes.labels(*labels).inc(event.reply_bytes)
+        for phase, elapsed in event.timings.items():
+            self.seconds.labels(*labels, phase).observe(elapsed)
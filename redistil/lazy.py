@@ -0,0 +1,98 @@
+__all__ = ['LazyContainer', 'LazyList', 'LazySet']
+
+class LazyContainer:
+    '''Proxy for a List or Set declared with lazy=True.
+    Values are fetched from Redis when they are accessed, rather than when the object is loaded,
+    and modifications are sent to Redis immediately instead of being written by Model.save.
+    '''
+    def __init__(self, db, key, field):
+        self.db = db
+        self.key = key
+        self.field = field
+
+    def _to_db(self, value):
+        return self.field.encode(value)
+
+    def _from_db(self, value):
+        return self.field.decode(value)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.key!r})'
+
+
+class LazyList(LazyContainer):
+    def __len__(self):
+        return self.db.llen(self.key)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is not None and index.step < 0:
+                return list(self)[index]
+            start = 0 if index.start is None else index.start
+            if index.stop == 0:
+                return []
+            stop = -1 if index.stop is None else index.stop - 1
+            values = [self._from_db(x) for x in self.db.lrange(self.key, start, stop)]
+            return values[::index.step]
+
+        value = self.db.lindex(self.key, index)
+        if value is None:
+            raise IndexError('list index out of range')
+        return self._from_db(value)
+
+    def __iter__(self):
+        # stream the list in windows of chunk_size values
+        size = self.field.chunk_size
+        start = 0
+        while True:
+            values = self.db.lrange(self.key, start, start + size - 1)
+            yield from (self._from_db(x) for x in values)
+            if len(values) < size:
+                return
+            start += size
+
+    def __contains__(self, value):
+        return self.db.lpos(self.key, self._to_db(value)) is not None
+
+    def append(self, value):
+        self.db.rpush(self.key, self._to_db(value))
+
+    def extend(self, values):
+        values = [self._to_db(x) for x in values]
+        for i in range(0, len(values), self.field.chunk_size):
+            self.db.rpush(self.key, *values[i:i + self.field.chunk_size])
+
+    def remove(self, value):
+        if not self.db.lrem(self.key, 1, self._to_db(value)):
+            raise ValueError(f'{value!r} not in list')
+
+
+class LazySet(LazyContainer):
+    def __len__(self):
+        return self.db.scard(self.key)
+
+    def __iter__(self):
+        # stream the set in batches of roughly chunk_size values
+        for value in self.db.sscan_iter(self.key, count=self.field.chunk_size):
+            yield self._from_db(value)
+
+    def __contains__(self, value):
+        return bool(self.db.sismember(self.key, self._to_db(value)))
+
+    def add(self, value):
+        self.db.sadd(self.key, self._to_db(value))
+
+    def update(self, values):
+        values = [self._to_db(x) for x in values]
+        for i in range(0, len(values), self.field.chunk_size):
+            self.db.sadd(self.key, *values[i:i + self.field.chunk_size])
+
+    def remove(self, value):
+        if not self.db.srem(self.key, self._to_db(value)):
+            raise KeyError(value)
+
+    def discard(self, value):
+        self.db.srem(self.key, self._to_db(value))
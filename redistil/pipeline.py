@@ -1,4 +1,9 @@
 
+__all__ = ['Promise', 'PromisePipeline', 'AsyncPromisePipeline']
+
+from redis.exceptions import NoScriptError
+from .instrumentation import tracers, payload_size, Span
+
 class Promise:
     def __init__(self):
         self.value = None
@@ -17,6 +22,15 @@ class PromisePipeline:
         self.db = db
         self.pipeline = self.db.pipeline(**kwargs)
         self.promises = []
+        # promise index -> (Script, keys, args) of commands queued by script
+        self.scripts = {}
+        # only measured when tracers are registered
+        self.request_bytes = 0
+        self.reply_bytes = 0
+
+    @property
+    def commands(self):
+        return len(self.promises)
 
     def _create_promise(self):
         self.promises.append(Promise())
@@ -36,15 +50,87 @@ class PromisePipeline:
 
             def wrap(*args, **kwargs):
                 attr(*args, **kwargs)
+                if tracers:
+                    self.request_bytes += payload_size(args) + payload_size(kwargs)
                 return self._create_promise()
             return wrap
 
+    def watch(self, *keys):
+        '''WATCH keys, so execute raises WatchError if another client modifies them first.
+        Commands queued afterwards are still sent as a single transaction.
+        '''
+        self.pipeline.watch(*keys)
+        self.pipeline.multi()
+
+    def script(self, script, keys=(), args=()):
+        '''Queue a Script with EVALSHA.
+        If the server doesn't know the script, execute loads it and runs the command again after
+        the rest of the pipeline, so the script must be safe to run after the commands queued after it.
+        '''
+        promise = self.evalsha(script.sha, len(keys), *keys, *args)
+        self.scripts[len(self.promises) - 1] = script, keys, args
+        return promise
+
+    def _missing_scripts(self, values):
+        return [i for i in self.scripts if isinstance(values[i], NoScriptError)]
+
+    def _queue_missing_scripts(self, missing):
+        p = self.db.pipeline(transaction=False)
+        for script in {self.scripts[i][0] for i in missing}:
+            p.script_load(script.source)
+        for i in missing:
+            script, keys, args = self.scripts[i]
+            p.evalsha(script.sha, len(keys), *keys, *args)
+        return p
+
+    def _replace_missing_scripts(self, values, missing, replies):
+        values = list(values)
+        for i, reply in zip(missing, replies[len(replies) - len(missing):]):
+            values[i] = reply
+        return values
+
     def execute(self):
         '''Execute the pipeline, take the resulting values and assign them to each promise.
         '''
-        values = self.pipeline.execute()
+        span = Span('execute') if tracers else None
+        # with scripts, errors are raised by _resolve once any missing scripts have been run
+        values = self.pipeline.execute(raise_on_error=not self.scripts)
+        missing = self._missing_scripts(values) if self.scripts else None
+        if missing:
+            values = self._replace_missing_scripts(values, missing, self._queue_missing_scripts(missing).execute())
+        if span:
+            span.mark('round_trip')
+        self._resolve(values)
+        if span:
+            self.reply_bytes = payload_size(values)
+            span.finish(self)
+        return values
+
+    def _resolve(self, values):
         for promise, value in zip(self.promises, values):
             if isinstance(value, Exception):
                 raise value
             promise.set(value)
+
+
+class AsyncPromisePipeline(PromisePipeline):
+    '''PromisePipeline for redis.asyncio clients.
+    Commands are queued in the same way, but watch and execute must be awaited.
+    '''
+    async def watch(self, *keys):
+        await self.pipeline.watch(*keys)
+        self.pipeline.multi()
+
+    async def execute(self):
+        span = Span('execute') if tracers else None
+        values = await self.pipeline.execute(raise_on_error=not self.scripts)
+        missing = self._missing_scripts(values) if self.scripts else None
+        if missing:
+            values = self._replace_missing_scripts(values, missing, await self._queue_missing_scripts(missing).execute())
+        if span:
+            span.mark('round_trip')
+        self._resolve(values)
+        if span:
+            self.reply_bytes = payload_size(values)
+            span.finish(self)
         return values
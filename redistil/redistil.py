@@ -1,20 +1,149 @@
+__all__ = [
+    'register_types_mapping', 'ConflictError',
+    'FieldBase', 'Field', 'Container', 'List', 'Set',
+    'Type', 'Boolean', 'Binary', 'Date', 'DateTime', 'Float', 'Integer', 'Number', 'String',
+    'EmailAddress', 'IPAddress', 'IPV4Address', 'IPV6Address',
+    'Model', 'Reference',
+]
+
+from copy import copy
+from time import sleep
+from random import random
 from inspect import isclass
-from datetime import date, datetime
+from threading import Lock
+from itertools import islice, chain
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+from datetime import date, datetime, timedelta
 from cerberus import Validator, TypeDefinition
+from redis.crc import key_slot
+from redis.exceptions import WatchError
 from ipaddress import IPv4Address, IPv6Address
-from .pipeline import PromisePipeline
+from .pipeline import PromisePipeline, AsyncPromisePipeline
+from .lazy import LazyContainer, LazyList, LazySet
+from .instrumentation import tracers, Span
+from .scripts import ScriptCommands, INCR, KEEP_TTL
+from .codecs import TextCodec, CompressedCodec
+from .router import Router
 
 def register_types_mapping(data):
     Validator.types_mapping.update(data)
 
+# model name -> Model, so References can name models which are declared later
+models = {}
+
+def register_model(cls):
+    models[cls.__name__] = cls
+
+def chunks(values, size):
+    values = iter(values)
+    while True:
+        chunk = list(islice(values, size))
+        if not chunk:
+            return
+        yield chunk
+
+def primary(db):
+    # reads made to update indexes must not be served by a lagging replica
+    return db.primary if isinstance(db, Router) else db
+
+def seconds(ttl):
+    return int(ttl.total_seconds()) if isinstance(ttl, timedelta) else ttl
+
+def execute_all(nodes, workers=None):
+    '''Execute each node's pipelines in order, the nodes concurrently in a thread pool of up to workers threads.
+    '''
+    def execute(pipelines):
+        for p in pipelines:
+            p.execute()
+    if len(nodes) > 1:
+        with ThreadPoolExecutor(min(workers or len(nodes), len(nodes))) as executor:
+            list(executor.map(execute, nodes))
+    else:
+        for pipelines in nodes:
+            execute(pipelines)
+
+def retry_watched(write):
+    '''Call write until it completes without raising WatchError, ie. until none of the keys
+    it watched were modified by another client before its transaction was executed.
+    '''
+    while True:
+        try:
+            return write()
+        except WatchError:
+            pass
+
+def node_name(db, slot):
+    # a cluster client maps slots to nodes, otherwise a single server holds every slot
+    nodes = getattr(primary(db), 'nodes_manager', None)
+    return nodes.get_node_from_slot(slot).name if nodes else None
+
+def flatten_types(types):
+    for t in types:
+        if isinstance(t, tuple):
+            yield from flatten_types(t)
+        else:
+            yield t
+
+
+class ConflictError(ValueError):
+    '''Raised by Model.save with check_version when another client saved the object first.
+    '''
+
+
+class ValidatorCache:
+    '''Bounded LRU of compiled Cerberus validators, keyed by frozensets of field names.
+    Validators are stateful, so they must only be used while holding the lock.
+    '''
+    def __init__(self, size):
+        self.size = size
+        self.lock = Lock()
+        self.validators = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.fast = 0
+
+    def get(self, key, create):
+        validator = self.validators.get(key)
+        if validator is not None:
+            self.hits += 1
+            self.validators.move_to_end(key)
+            return validator
+
+        self.misses += 1
+        validator = self.validators[key] = create()
+        if len(self.validators) > self.size:
+            self.validators.popitem(last=False)
+        return validator
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'fast': self.fast, 'size': len(self.validators)}
+
 
 class FieldBase:
     schema = None
 
-    def __init__(self, type, **kwargs):
+    def __init__(self, type, codec=None, compress=None, threshold=1024, **kwargs):
         self.type = type() if isclass(type) else type
         self.owner = None
         self.name = None
+        # types which don't override get or set return values unchanged, so they can be skipped
+        self.plain_get = self.type.__class__.get is Type.get
+        self.plain_set = self.type.__class__.set is Type.set
+        # models apply Meta.codec to fields which don't specify one
+        self.codec = codec
+        self.compress = compress
+        self.threshold = threshold
+        self.set_codec(codec or TextCodec())
+
+    def set_codec(self, codec):
+        self.compression = None
+        if self.compress:
+            codec = self.compression = CompressedCodec(codec, self.compress, self.threshold)
+        self.resolved_codec = codec
+        self.encode = codec.encoder(self.type)
+        self.decode = codec.decoder(self.type)
 
     def __set_name__(self, owner, name):
         self.name = name
@@ -22,8 +151,16 @@ class FieldBase:
         self.type.__set_name__(owner, name)
 
     def __set__(self, instance, value):
-        value = self.type.set(instance, value)
+        if not self.plain_set:
+            value = self.set(instance, value)
         instance._data[self.name] = value
+        if instance._dirty is None:
+            instance._dirty = {self.name}
+        else:
+            instance._dirty.add(self.name)
+
+    def set(self, instance, value):
+        return self.type.set(instance, value)
 
     def __get__(self, instance, value):
         # instance is null when the field is being accessed via the class, not an object
@@ -32,32 +169,45 @@ class FieldBase:
             return self
 
         value = instance._data.get(self.name)
+        if self.plain_get:
+            return value
         value = self.type.get(instance, value)
         # update the value incase it changed
         instance._data[self.name] = value
         return value
 
     def to_db(self, value):
-        return self.type.to_db(value)
+        return self.encode(value)
 
     def from_db(self, value):
-        return self.type.from_db(value)
+        return self.decode(value)
 
     def save(self, key, field, data):
         raise NotImplementedError
 
+    def update(self, db, key, field, value, original):
+        '''Save only the difference between original and value.
+        Returns False if the difference can't be expressed, in which case save is used instead.
+        '''
+        return False
+
     def load(self, key, field):
         raise NotImplementedError
 
 
 class Field(FieldBase):
-    def __init__(self, type, primary_key=False, **kwargs):
-        super().__init__(type, **kwargs)
+    def __init__(self, type, primary_key=False, index=False, version=False, codec=None, compress=None, threshold=1024, **kwargs):
+        super().__init__(type, codec, compress, threshold)
         self.schema = {**self.type.schema, **kwargs}
 
         self.primary_key = primary_key
         if self.primary_key:
             self.schema['required'] = True
+        self.index = index
+        # the version is incremented by the server whenever the object is saved
+        self.version = version
+        if self.version and not isinstance(self.type, Integer):
+            raise TypeError('Version fields must be Integers')
 
     def save(self, db, key, field, value):
         db.hset(key, field, value)
@@ -71,14 +221,40 @@ class Field(FieldBase):
     def field(self):
         return self.name
 
+    def index_key(self, value=None):
+        '''Types with a score are indexed in a single sorted set, others in a set per value.
+        '''
+        key = f'{self.owner.__name__}:index:{self.name}'
+        if self.type.score is None:
+            key = f'{key}:{self.type.to_db(value)}'
+        return key
+
+    def add_index(self, db, id, value):
+        if self.type.score is None:
+            return db.sadd(self.index_key(value), id)
+        return db.zadd(self.index_key(), {id: self.type.score(value)})
+
+    def remove_index(self, db, id, value):
+        if self.type.score is None:
+            db.srem(self.index_key(value), id)
+        else:
+            db.zrem(self.index_key(), id)
+
 
 class Container(FieldBase):
-    def __init__(self, type, **kwargs):
+    def __init__(self, type, swap=False, chunk_size=1000, lazy=False, codec=None, compress=None, threshold=1024, **kwargs):
         if type.schema['type'] in ['list', 'set', 'dict']:
             raise TypeError('Container fields are not nestable')
-        super().__init__(type, **kwargs)
+        # the codec and compression are applied to each member
+        super().__init__(type, codec, compress, threshold)
         self.schema = {**self.schema, **kwargs}
         self.schema['schema'] = self.type.schema
+        self.swap = swap
+        self.chunk_size = chunk_size
+        self.lazy = lazy
+
+    def proxy(self, db, key):
+        raise NotImplementedError
 
     def delete(self, db, key, field):
         db.delete(self.key(key))
@@ -86,16 +262,34 @@ class Container(FieldBase):
     def key(self, key):
         return f'{key}::{self.name}'
 
+    def replace(self, db, key, data, push):
+        '''Replace the contents of key using variadic push commands of at most chunk_size values.
+        When swap is enabled the values are written to a temporary key which is then renamed
+        over key, so readers never see an empty or partially written container.
+        '''
+        if not self.swap:
+            db.delete(key)
+            for values in chunks(data, self.chunk_size):
+                push(key, *values)
+        elif not data:
+            db.delete(key)
+        else:
+            temp_key = f'{key}::{uuid4().hex}'
+            for values in chunks(data, self.chunk_size):
+                push(temp_key, *values)
+            db.rename(temp_key, key)
+
 
 class List(Container):
     schema = {'type': 'list'}
 
     def replace_list(self, db, key, data):
-        db.delete(key)
-        for value in data:
-            db.rpush(key, value)
+        self.replace(db, key, data, db.rpush)
 
     def set(self, instance, value):
+        # containers apply the type to each member
+        if value is None or isinstance(value, LazyContainer):
+            return value
         return [self.type.set(instance, item) for item in value]
 
     def get(self, instance, value):
@@ -104,14 +298,25 @@ class List(Container):
     def save(self, db, key, field, value):
         self.replace_list(db, self.key(key), value)
 
+    def update(self, db, key, field, value, original):
+        # only appended values can be pushed, anything else requires a replace
+        if value[:len(original)] != original:
+            return False
+        for values in chunks(value[len(original):], self.chunk_size):
+            db.rpush(self.key(key), *values)
+        return True
+
     def load(self, db, key, field):
         return db.lrange(self.key(key), 0, -1)
 
+    def proxy(self, db, key):
+        return LazyList(db, self.key(key), self)
+
     def to_db(self, value):
-        return [self.type.to_db(x) for x in value]
+        return [self.encode(x) for x in value]
 
     def from_db(self, value):
-        return [self.type.from_db(x) for x in value]
+        return [self.decode(x) for x in value]
 
 
 
@@ -119,27 +324,38 @@ class Set(Container):
     schema = {'type': 'set'}
 
     def replace_set(self, db, key, data):
-        db.delete(key)
-        for value in data:
-            db.sadd(key, value)
+        self.replace(db, key, data, db.sadd)
 
     def save(self, db, key, field, value):
         self.replace_set(db, self.key(key), value)
 
+    def update(self, db, key, field, value, original):
+        key = self.key(key)
+        for values in chunks(original - value, self.chunk_size):
+            db.srem(key, *values)
+        for values in chunks(value - original, self.chunk_size):
+            db.sadd(key, *values)
+        return True
+
     def load(self, db, key, field):
         return db.smembers(self.key(key))
 
+    def proxy(self, db, key):
+        return LazySet(db, self.key(key), self)
+
     def set(self, instance, value):
+        if value is None or isinstance(value, LazyContainer):
+            return value
         return {self.type.set(instance, item) for item in value}
 
     def get(self, instance, value):
         return {self.type.get(instance, item) for item in value} if value else None
 
     def to_db(self, value):
-        return {self.type.to_db(x) for x in value}
+        return {self.encode(x) for x in value}
 
     def from_db(self, value):
-        return {self.type.from_db(x) for x in value}
+        return {self.decode(x) for x in value}
 
 # Dict type not provided as they can just be flattened into the Model
 # or a secondary Model can be referenced
@@ -158,6 +374,8 @@ class Type(object, metaclass=TypeMeta):
     schema = None
     to_db = lambda self, value: value
     from_db = lambda self, value: value
+    # types with a score can be range indexed
+    score = None
 
     def __init__(self, **kwargs):
         self.schema.update(**kwargs)
@@ -189,23 +407,28 @@ class Date(Type):
     schema = {'type': 'date'}
     to_db = lambda self, value: value.isoformat()
     from_db = lambda self, value: date.fromisoformat(value.decode('utf-8'))
+    score = lambda self, value: value.toordinal()
 
 class DateTime(Type):
     schema = {'type': 'datetime'}
     to_db = lambda self, value: value.isoformat()
     from_db = lambda self, value: datetime.fromisoformat(value.decode('utf-8'))
+    score = lambda self, value: value.timestamp()
 
 class Float(Type):
     schema = {'type': 'float'}
     from_db = lambda self, value: float(value)
+    score = lambda self, value: float(value)
 
 class Integer(Type):
     schema = {'type': 'integer'}
     from_db = lambda self, value: int(value)
+    score = lambda self, value: float(value)
 
 class Number(Type):
     schema = {'type': 'number'}
     from_db = lambda self, value: float(value)
+    score = lambda self, value: float(value)
 
 class String(Type):
     schema = {'type': 'string'}
@@ -235,34 +458,100 @@ class IPV6Address(Type):
 
 
 
+# instance state, see Model.__init__
+INSTANCE_SLOTS = ('_data', '_dirty', '_original', '_persisted')
+
 class ModelMeta(type):
     def __new__(metacls, name, bases, namespace, **kwargs):
         def discover_fields():
             return {k:v for k,v in namespace.items() if isinstance(v, FieldBase)}
         def determine_primary_key(fields):
             # ensure we have exactly one primary key
-            # don't do this check for the base Model class
-            if name != 'Model':
+            # don't do this check for abstract models such as the base Model class
+            if not vars(namespace.get('Meta', object)).get('abstract'):
                 # filter fields that cant be primary keys
                 fields = {k:v for k, v in fields.items() if isinstance(v, Field)}
                 primary_keys = [field_name for field_name, field in fields.items() if field.primary_key]
                 if len(primary_keys) != 1:
                     raise TypeError(f'{name} must have one field specified as primary_key')
                 return primary_keys[0]
+        def determine_version_field(fields):
+            versions = [k for k, v in fields.items() if isinstance(v, Field) and v.version]
+            if len(versions) > 1:
+                raise TypeError(f'{name} can only have one version field')
+            return versions[0] if versions else None
         def create_schema():
             return {name: field.schema for name, field in fields.items()}
         def register_model_(cls):
             if name != 'Model':
                 register_model(cls)
+        def create_slots():
+            # only add the slots which bases don't already have
+            existing = {slot for base in bases for klass in base.__mro__ for slot in vars(klass).get('__slots__', ())}
+            return tuple(slot for slot in INSTANCE_SLOTS if slot not in existing)
+        def create_meta():
+            # inherit options from base models, then apply our own Meta
+            meta = {}
+            for base in reversed(bases):
+                meta.update(getattr(base, '_meta', {}))
+            # abstract is not inherited
+            meta.pop('abstract', None)
+            if 'Meta' in namespace:
+                meta.update({k:v for k,v in vars(namespace['Meta']).items() if not k.startswith('_')})
+            return meta
 
         fields = discover_fields()
         namespace['_fields'] = fields
+        namespace['_hash_fields'] = {k for k,v in fields.items() if isinstance(v, Field)}
+        # stored field name -> field name, so loaded objects share their keys rather than each decoding its own
+        namespace['_hash_keys'] = {**{k: k for k in namespace['_hash_fields']}, **{k.encode('utf-8'): k for k in namespace['_hash_fields']}}
+        namespace['_index_fields'] = {k for k,v in fields.items() if isinstance(v, Field) and v.index}
+        namespace['_lazy_fields'] = {k for k,v in fields.items() if isinstance(v, Container) and v.lazy}
+        namespace['_reference_fields'] = {k for k,v in fields.items() if isinstance(v.type, Reference)}
         namespace['_primary_key'] = determine_primary_key(fields)
+        namespace['_version_field'] = determine_version_field(fields)
         namespace['_schema'] = create_schema()
+        namespace['_meta'] = create_meta()
+        namespace['_validator_cache'] = ValidatorCache(namespace['_meta'].get('validator_cache_size', 0))
 
-        return super().__new__(metacls, name, bases, namespace, **kwargs)
+        if namespace['_meta'].get('blob') and namespace['_version_field']:
+            raise TypeError(f'{name} can not have a version field and Meta.blob')
+        if namespace['_meta'].get('slots') and '__slots__' not in namespace:
+            namespace['__slots__'] = create_slots()
+
+        cls = super().__new__(metacls, name, bases, namespace, **kwargs)
+        cls._fast_fields = cls._find_fast_fields()
+        for field in fields.values():
+            field.set_codec(field.codec or cls._meta.get('codec') or TextCodec())
+        register_model_(cls)
+        return cls
 
 class Model(object, metaclass=ModelMeta):
+    # models only lose their __dict__ if every class has __slots__, see Meta.slots
+    __slots__ = ()
+
+    class Meta:
+        abstract = True
+        # keep a copy of loaded/saved values so in-place modifications can be detected
+        # and containers can be saved as deltas
+        snapshots = True
+        # number of compiled validators to cache per model
+        validator_cache_size = 128
+        # check plain fields without going through cerberus
+        fast_validation = True
+        # seconds (or a timedelta) until objects expire after being saved
+        ttl = None
+        # also reset the ttl whenever objects are loaded
+        sliding_ttl = False
+        # give containers written by saves without a ttl the hash's remaining ttl,
+        # enabled once objects of the model are saved with a ttl
+        keep_ttl = False
+        # wrap ids in a hash tag so an object's hash and container keys are in the same cluster slot
+        hash_tags = False
+        # store instance state in __slots__ rather than a __dict__, which saves memory
+        # but prevents assigning attributes which aren't fields
+        slots = False
+
     class Validator(Validator):
         # cerberus helpers for common normalize/coerce functions
         def _normalize_default_setter_utcnow(self, document):
@@ -277,23 +566,463 @@ class Model(object, metaclass=ModelMeta):
         obj.save(db)
         return obj
 
+    @classmethod
+    def update(cls, db, id, fn, *fields, retries=5, backoff=0.01):
+        '''Load an object, modify it by calling fn(obj) and save it with check_version.
+        If another client saved the object first, it is loaded and modified again after sleeping
+        for a random backoff which doubles with each attempt. ConflictError is raised once
+        retries is exhausted. Returns the saved object.
+        '''
+        for attempt in range(retries + 1):
+            obj = cls.load(db, id, *fields)
+            fn(obj)
+            try:
+                obj.save(db, check_version=True)
+                return obj
+            except ConflictError:
+                # the object may have been cached before the other client saved it
+                obj._invalidate_cache()
+                if attempt == retries:
+                    raise
+            sleep(backoff * 2 ** attempt * random())
+
+    @classmethod
+    def _get_version_field(cls):
+        if not cls._version_field:
+            raise TypeError(f'{cls.__name__} does not have a version field')
+        return cls._fields.get(cls._version_field)
+
+    def _get_version_check(self):
+        # the version field of an object being saved with check_version
+        version_field = self._get_version_field()
+        if self._persisted and version_field.name not in self._data:
+            raise ValueError(f'{version_field.name} must be loaded to save {self.redis_key} with check_version')
+        return version_field
+
     @classmethod
     def key(cls, id):
+        if cls._meta.get('hash_tags'):
+            return f'{cls.__name__}::{{{id}}}'
         return f'{cls.__name__}::{id}'
 
+    @classmethod
+    def key_prefix(cls):
+        '''The prefix of every key of this model.
+        '''
+        return f'{cls.__name__}::'
+
     @classmethod
     def primary_key(cls):
         return cls._primary_key
 
     @classmethod
-    def load(cls, db, id, *fields):
+    def validator_stats(cls):
+        '''Returns the validator cache hits, misses, fast path validations and cache size.
+        '''
+        return cls._validator_cache.stats()
+
+    @classmethod
+    def compression_stats(cls):
+        '''Returns the number of values written, how many were compressed, their raw and stored
+        sizes and the ratio of stored to raw bytes for each compressed field.
+        '''
+        return {name: field.compression.stats() for name, field in cls._fields.items() if field.compression}
+
+    @classmethod
+    def _find_fast_fields(cls):
+        '''Find fields whose only rules are type/required/nullable with a simple type check.
+        These can be validated inline, as cerberus normalization would not modify them.
+        '''
+        if not cls._meta.get('fast_validation'):
+            return {}
+        fast_types = ('integer', 'float', 'string', 'binary')
+        fields = {}
+        for name, schema in cls._schema.items():
+            if schema.get('type') not in fast_types or not set(schema) <= {'type', 'required', 'nullable'}:
+                continue
+            definition = cls.Validator.types_mapping[schema['type']]
+            fields[name] = (
+                tuple(flatten_types(definition.included_types)),
+                tuple(flatten_types(definition.excluded_types)),
+                schema.get('required', False),
+                schema.get('nullable', False),
+            )
+        return fields
+
+    @classmethod
+    def load(cls, db, id, *fields, include=(), depth=1):
         # always load the primary key directly from the requested id
         obj = cls(**{cls.primary_key(): id})
-        obj.load_fields(db, *fields)
+        obj.load_fields(db, *fields, include=include, depth=depth)
+        return obj
+
+    @classmethod
+    def load_many(cls, db, ids, *fields, chunk_size=1000, decode_workers=None, include=(), depth=1):
+        '''Load many objects, batching the requests into pipelines of chunk_size objects.
+        Objects are returned in the same order as ids, missing objects are returned as None.
+        If decode_workers is set, values are decoded in a thread pool, which helps when
+        decompressing large values as zlib and lzma release the GIL.
+        include and depth load referenced objects, see load_references.
+        '''
+        objs = [cls(**{cls.primary_key(): id}) for id in ids]
+        executor = ThreadPoolExecutor(decode_workers) if decode_workers else None
+        result = []
+        try:
+            for chunk in chunks(objs, chunk_size):
+                p = PromisePipeline(db)
+                queued = cls._queue_load_many(p, chunk, *fields)
+                p.execute()
+                result.extend(cls._apply_load_many(chunk, queued, executor))
+        finally:
+            if executor:
+                executor.shutdown()
+        if include:
+            cls.load_references(db, result, include, depth)
+        return result
+
+    @classmethod
+    def load_references(cls, db, objs, include=True, depth=1):
+        '''Load the objects referenced by the Reference fields of objs.
+        include is a list of Reference fields, of any model, to follow or True to follow every one.
+        Objects referenced by the loaded objects are then loaded, up to depth references away.
+        Each level is a single pipeline, objects referenced more than once are requested once.
+        '''
+        for _ in range(depth):
+            p = PromisePipeline(db)
+            queued = cls._queue_references(p, objs, include)
+            if not queued:
+                break
+            p.execute()
+            objs = cls._apply_references(queued)
+
+    @classmethod
+    def _queue_references(cls, p, objs, include):
+        # referenced key -> (queued load, referenced objects)
+        queued = {}
+        for obj in objs:
+            if obj is None:
+                continue
+            for name in obj._reference_fields:
+                field = obj._fields[name]
+                value = obj._data.get(name)
+                if (include is not True and field not in include) or value is None or isinstance(value, LazyContainer):
+                    continue
+                for ref in value if isinstance(field, Container) else (value,):
+                    # only load references which only have their primary key, ie. haven't been loaded
+                    if ref._dirty or not ref._data.keys() <= {ref.primary_key()}:
+                        continue
+                    if ref.redis_key not in queued:
+                        queued[ref.redis_key] = ref._queue_load(p, ref._schema.keys()), []
+                    queued[ref.redis_key][1].append(ref)
+        return list(queued.values())
+
+    @classmethod
+    def _apply_references(cls, queued):
+        refs = []
+        for values, objs in queued:
+            for obj in objs:
+                obj._apply_load(values)
+            refs.extend(objs)
+        return refs
+
+    @classmethod
+    def load_columns(cls, db, ids, *fields, chunk_size=1000):
+        '''Load hash fields of many objects as columns, without creating any objects.
+        Returns a dict of field name to numpy array, in the same order as ids.
+        Numeric, Boolean, Date and DateTime columns are decoded in bulk, missing values are masked.
+        Other fields are returned as object arrays, with None for missing values.
+        Requires numpy.
+        '''
+        from .columns import decode_column
+        names = [field.name for field in fields] or [name for name in cls._fields if name in cls._hash_fields]
+        for name in names:
+            if name not in cls._hash_fields:
+                raise TypeError(f'{name} is not a hash field')
+        primary_field = cls._fields.get(cls.primary_key())
+
+        columns = {name: [] for name in names}
+        for chunk in chunks(ids, chunk_size):
+            p = PromisePipeline(db)
+            promises = [cls._queue_hash(p, cls.key(primary_field.type.to_db(id)), names) for id in chunk]
+            p.execute()
+            for promise in promises:
+                values = cls._hash_values(names, promise.value)
+                for name in names:
+                    columns[name].append(values.get(name))
+        return {name: decode_column(cls._fields.get(name), values) for name, values in columns.items()}
+
+    @classmethod
+    def save_many(cls, db, objs, *fields, chunk_size=1000, ttl=None, workers=None):
+        '''Save many objects, batching the requests into transactions of chunk_size objects.
+        All objects are validated before anything is written.
+        With Meta.hash_tags each chunk has a transaction per hash slot, the transactions of each
+        cluster node are executed concurrently, in a thread pool of up to workers threads if it is set.
+        '''
+        queued = cls._validate_many(objs, *fields)
+        for chunk in chunks(queued, chunk_size):
+            nodes, versions = cls._write_many(db, chunk, ttl, workers)
+            for (obj, field_names, data), version in zip(chunk, versions):
+                obj._mark_saved(field_names, version)
+
+    @classmethod
+    def _write_many(cls, db, queued, ttl=None, workers=None, span=None):
+        '''Write (obj, field_names, data) tuples, updating their index entries.
+        Returns the pipelines of each node and the version promise of each object.
+        The hashes whose stored values are read to move their index entries are watched first,
+        and the write is retried if another client modifies them before it.
+        '''
+        def write():
+            p = PromisePipeline(db, transaction=True)
+            indexed = cls._read_indexed(db, [(obj, field_names) for obj, field_names, data in queued], p)
+            if span:
+                span.mark('round_trip')
+            nodes, versions = cls._queue_save_many(db, [(*item, previous) for item, previous in zip(queued, indexed)], ttl, transaction=p)
+            if span:
+                span.mark('encode')
+            execute_all(nodes, workers)
+            if span:
+                span.mark('round_trip')
+            return nodes, versions
+        return retry_watched(write)
+
+    @classmethod
+    def _queue_save_many(cls, db, queued, ttl=None, pipeline=PromisePipeline, transaction=None):
+        '''Queue the writes of (obj, field_names, data, previous) tuples.
+        Returns a list of pipelines per node, to be executed in order, and the version promise of each object.
+        Objects are written in a single transaction, the transaction pipeline if it is given,
+        unless Meta.hash_tags is set, in which case there is a transaction per hash slot,
+        as a cluster requires a transaction's keys share a slot.
+        Indexes are in other slots, so they are then updated in a pipeline which isn't a transaction.
+        '''
+        if not cls._meta.get('hash_tags'):
+            p = transaction if transaction is not None else pipeline(db, transaction=True)
+            return [[p]], [obj._queue_save(p, data, field_names, previous, ttl) for obj, field_names, data, previous in queued]
+
+        slots = {}
+        for i, (obj, field_names, data, previous) in enumerate(queued):
+            slots.setdefault(key_slot(obj.redis_key.encode('utf-8')), []).append(i)
+        nodes = {}
+        versions = [None] * len(queued)
+        for slot, indexes in slots.items():
+            p = pipeline(db, transaction=True)
+            for i in indexes:
+                obj, field_names, data, previous = queued[i]
+                versions[i] = obj._queue_save(p, data, field_names, None, ttl)
+            nodes.setdefault(node_name(db, slot), []).append(p)
+        nodes = list(nodes.values())
+        p = pipeline(db, transaction=False)
+        for obj, field_names, data, previous in queued:
+            obj._queue_index(p, data, field_names, previous)
+        if p.commands:
+            # it routes its own commands, so it's executed after the first node's transactions
+            nodes[0].append(p)
+        return nodes, versions
+
+    @classmethod
+    def delete_many(cls, db, objs, chunk_size=1000):
+        for chunk in chunks(objs, chunk_size):
+            cls._delete_many(db, chunk)
+            for obj in chunk:
+                obj._mark_deleted()
+
+    @classmethod
+    def _delete_many(cls, db, objs, span=None):
+        '''Delete objs in a transaction, which is retried if their indexed values are modified, see _write_many.
+        Returns the pipeline.
+        '''
+        def write():
+            p = PromisePipeline(db, transaction=True)
+            indexed = cls._read_indexed(db, [(obj, obj._index_fields) for obj in objs], p)
+            for obj, previous in zip(objs, indexed):
+                obj._queue_delete(p, previous)
+            if span:
+                span.mark('encode')
+            p.execute()
+            if span:
+                span.mark('round_trip')
+            return p
+        return retry_watched(write)
+
+    @classmethod
+    def _queue_load_many(cls, p, objs, *fields):
+        return [obj._queue_load(p, obj._load_field_names(*fields)) for obj in objs]
+
+    @classmethod
+    def _apply_load_many(cls, objs, queued, executor=None):
+        def apply(obj, queued):
+            obj._apply_load(queued)
+            return obj if obj._persisted else None
+        if executor:
+            return list(executor.map(apply, objs, queued))
+        return [apply(obj, values) for obj, values in zip(objs, queued)]
+
+    @classmethod
+    def find_ids(cls, db, **values):
+        '''Returns the ids of objects whose indexed fields are equal to all of the values.
+        '''
+        p = PromisePipeline(db)
+        results = cls._queue_find_ids(p, **values)
+        p.execute()
+        return cls._apply_find_ids(results)
+
+    @classmethod
+    def _queue_find_ids(cls, p, **values):
+        results = []
+        for name, value in values.items():
+            field = cls._fields.get(name)
+            if name not in cls._index_fields:
+                raise ValueError(f'{name} is not an indexed field')
+            if field.type.score is None:
+                results.append(p.smembers(field.index_key(value)))
+            else:
+                score = field.type.score(value)
+                results.append(p.zrangebyscore(field.index_key(), score, score))
+        return results
+
+    @classmethod
+    def _apply_find_ids(cls, results):
+        ids = set.intersection(*[set(result.value) for result in results]) if results else set()
+        return cls._index_ids(sorted(ids))
+
+    @classmethod
+    def find_by(cls, db, *fields, **values):
+        '''Load the objects whose indexed fields are equal to all of the values.
+        '''
+        ids = cls.find_ids(db, **values)
+        return [obj for obj in cls.load_many(db, ids, *fields) if obj is not None]
+
+    @classmethod
+    def range_ids(cls, db, field, lo=None, hi=None, limit=None, offset=0):
+        '''Returns the ids of objects whose range indexed field is between lo and hi inclusive,
+        ordered by the field's value.
+        '''
+        args, kwargs = cls._range_args(field, lo, hi, limit, offset)
+        return cls._index_ids(db.zrangebyscore(*args, **kwargs))
+
+    @classmethod
+    def _range_args(cls, field, lo, hi, limit, offset):
+        if field.name not in cls._index_fields or field.type.score is None:
+            raise ValueError(f'{field.name} is not a range indexed field')
+        lo = '-inf' if lo is None else field.type.score(lo)
+        hi = '+inf' if hi is None else field.type.score(hi)
+        kwargs = {} if limit is None else {'start': offset, 'num': limit}
+        return (field.index_key(), lo, hi), kwargs
+
+    @classmethod
+    def range(cls, db, field, lo=None, hi=None, *fields, limit=None, offset=0):
+        '''Load the objects whose range indexed field is between lo and hi inclusive.
+        '''
+        ids = cls.range_ids(db, field, lo, hi, limit=limit, offset=offset)
+        return [obj for obj in cls.load_many(db, ids, *fields) if obj is not None]
+
+    @classmethod
+    def iter_ids(cls, db, batch=500):
+        '''Iterate over the ids of every object of this model using SCAN.
+        As with SCAN, an id may be returned more than once if keys are modified during iteration.
+        '''
+        for key in db.scan_iter(match=cls.key_prefix() + '*', count=batch):
+            id = cls._key_id(key)
+            if id is not None:
+                yield id
+
+    @classmethod
+    def _key_id(cls, key):
+        '''Returns the id of the object whose hash is key, or None for container keys.
+        '''
+        key = key.encode('utf-8') if isinstance(key, str) else key
+        id = key[len(cls.key_prefix()):]
+        if cls._is_container_key(id):
+            return None
+        if cls._meta.get('hash_tags'):
+            id = id[1:-1]
+        # keys are always text, regardless of the field's codec
+        return cls._fields.get(cls.primary_key()).type.from_db(id)
+
+    @classmethod
+    def _is_container_key(cls, id):
+        # container keys, and the temporary keys used to swap them, are suffixed to the object key
+        for name in cls._fields.keys() - cls._hash_fields:
+            suffix = f'::{name}'.encode('utf-8')
+            if id.endswith(suffix) or suffix + b'::' in id:
+                return True
+        return False
+
+    @classmethod
+    def iter_all(cls, db, *fields, batch=500, ids_only=False, workers=None):
+        '''Iterate over every object of this model.
+        Ids are found using SCAN and each batch of objects is loaded in a single pipeline.
+        If workers is set, batches are loaded concurrently in a thread pool, with
+        each thread using its own connection from the client's connection pool.
+        '''
+        ids = cls.iter_ids(db, batch)
+        if ids_only:
+            yield from ids
+            return
+
+        if not workers:
+            for chunk in chunks(ids, batch):
+                yield from filter(None, cls.load_many(db, chunk, *fields, chunk_size=batch))
+            return
+
+        with ThreadPoolExecutor(workers) as executor:
+            # limit the number of batches in flight to keep memory use constant
+            pending = deque()
+            for chunk in chunks(ids, batch):
+                pending.append(executor.submit(cls.load_many, db, chunk, *fields, chunk_size=batch))
+                if len(pending) > workers:
+                    yield from filter(None, pending.popleft().result())
+            while pending:
+                yield from filter(None, pending.popleft().result())
+
+    @classmethod
+    def _index_ids(cls, ids):
+        primary_field = cls._fields.get(cls.primary_key())
+        return [primary_field.type.from_db(id) for id in ids]
+
+    @classmethod
+    def _read_indexed(cls, db, queued, watch=None):
+        '''Read the stored values of the indexed fields of each (obj, field_names) pair in a single
+        pipeline, so their index entries can be moved.
+        If watch is a transaction pipeline, the hashes are watched before they're read, so it raises
+        WatchError if they are modified before it's executed. With hash tags indexes are updated
+        after the transactions, so they aren't watched.
+        '''
+        p = PromisePipeline(primary(db))
+        reads = [obj._queue_indexed(p, field_names) for obj, field_names in queued]
+        if any(reads):
+            keys = [obj.redis_key for (obj, _), read in zip(queued, reads) if read and not obj._meta.get('hash_tags')]
+            if watch is not None and keys:
+                watch.watch(*keys)
+            p.execute()
+        return [obj._apply_indexed(read) for (obj, _), read in zip(queued, reads)]
+
+    @classmethod
+    def _validate_many(cls, objs, *fields):
+        queued = [(obj, obj._save_field_names(*fields)) for obj in objs]
+        return [(obj, field_names, obj.validate(field_names)) for obj, field_names in queued if field_names]
+
+    @classmethod
+    def trusted(cls, **values):
+        '''Create an object from values which are already the right types, such as values
+        decoded from Redis, without going through each field.
+        The object is treated as loaded, so saving it only writes fields assigned afterwards.
+        Values aren't snapshotted, so in-place modifications aren't detected.
+        '''
+        obj = cls.__new__(cls)
+        obj._data = values
+        obj._dirty = None
+        obj._original = None
+        obj._persisted = True
         return obj
 
     def __init__(self, **values):
         self._data = {}
+        # names of fields assigned since they were last loaded or saved
+        # this and _original are None while empty, as most objects never need them
+        self._dirty = None
+        # values as they were last loaded or saved
+        self._original = None
+        self._persisted = False
         for k,v in values.items():
             setattr(self, k, v)
 
@@ -303,85 +1032,517 @@ class Model(object, metaclass=ModelMeta):
 
     @property
     def redis_key(self):
+        return self.key(self._db_id)
+
+    @property
+    def _db_id(self):
         primary_field = self._fields.get(self.primary_key())
-        id_ = primary_field.type.to_db(self.id)
-        return self.key(id_)
+        return primary_field.type.to_db(self.id)
 
     @property
     def schema(self):
         return self._schema
 
-    def load_fields(self, db, *fields):
+    @property
+    def dirty_fields(self):
+        '''Names of the fields which have changed since they were last loaded or saved.
+        '''
+        dirty = set(self._dirty or ())
+        if self._original:
+            dirty.update(k for k, v in self._original.items() if self._data.get(k) != v)
+        return dirty
+
+    def _mark_clean(self, field_names):
+        self._persisted = True
+        if self._dirty:
+            self._dirty.difference_update(field_names)
+            if not self._dirty:
+                self._dirty = None
+        if self._meta.get('blob'):
+            # fields which weren't set are known to be unset in the blob
+            for name in self._hash_fields.intersection(field_names):
+                self._data.setdefault(name, None)
+        if self._meta.get('snapshots'):
+            for name in field_names:
+                value = self._data.get(name)
+                if value is None or isinstance(value, LazyContainer):
+                    if self._original:
+                        self._original.pop(name, None)
+                    continue
+                if self._original is None:
+                    self._original = {}
+                # references are compared by identity
+                self._original[name] = value if isinstance(value, Model) else copy(value)
+
+    def _mark_saved(self, field_names, version=None):
+        # the version promise returned by _queue_save
+        if version is not None:
+            self._data[self._version_field] = int(version.value)
+            field_names = {*field_names, self._version_field}
+        self._mark_clean(field_names)
+        self._invalidate_cache()
+
+    def _mark_deleted(self):
+        self._persisted = False
+        self._original = None
+        self._dirty = {*(self._dirty or ()), *(k for k, v in self._data.items() if v is not None)} or None
+        self._invalidate_cache()
+
+    def _invalidate_cache(self):
+        cache = self._meta.get('cache')
+        if cache is not None:
+            cache.invalidate(self.redis_key)
+
+    def _load_cached(self, cache, field_names):
+        values = cache.get(self.redis_key, field_names)
+        if values is None:
+            return False
+        self._set_loaded(values)
+        return True
+
+    def load_fields(self, db, *fields, include=(), depth=1):
+        field_names = self._load_field_names(*fields)
+        cache = self._meta.get('cache')
+        if cache is not None:
+            token = cache.token()
+            if self._load_cached(cache, field_names):
+                # nothing is read, but the ttl is still reset
+                p = PromisePipeline(db, transaction=False)
+                self._queue_refresh(p)
+                if p.commands:
+                    p.execute()
+                if include:
+                    self.load_references(db, [self], include, depth)
+                return
+
+        span = Span('load_fields', self.__class__, field_names) if tracers else None
+
+        # create a pipeline and get the values all at once
+        p = PromisePipeline(db)
+        values = self._queue_load(p, field_names)
+        if span:
+            span.mark('encode')
+        p.execute()
+        if span:
+            span.mark('round_trip')
+        values = self._apply_load(values)
+        if span:
+            span.mark('decode')
+            span.finish(p)
+
+        # missing objects aren't cached, a hit is always loaded as an existing object
+        if cache is not None and self._persisted:
+            cache.set(self.redis_key, field_names, values, token)
+        if include:
+            self.load_references(db, [self], include, depth)
+
+    def _field_names(self, *fields):
+        return {field.name for field in fields} if fields else self._schema.keys()
+
+    def _load_field_names(self, *fields):
+        # the version is always loaded, so objects can be saved with check_version
+        field_names = self._field_names(*fields)
+        if fields and self._version_field:
+            field_names.add(self._version_field)
+        return field_names
+
+    def _queue_load(self, p, field_names):
         def loader(field_name):
             return self._fields.get(field_name).load
-        def py_value(field_name, value):
-            fn = self._fields.get(field_name).from_db
-            return fn(value)
 
         # ensure the id is db friendly
         key = self.redis_key
-        field_names = {field.name for field in fields} if fields else self._schema.keys()
-
-        # create a pipeline and get the values all at once
-        p = PromisePipeline(db)
-        values = {name: loader(name)(p, key, name) for name in field_names}
-        p.execute()
+        # hash fields are fetched with a single command
+        # each container requires its own command
+        hash_names = [name for name in field_names if name in self._hash_fields]
+        hash_values = self._queue_hash(p, key, hash_names) if hash_names else None
+        # lazy containers are fetched when accessed, async clients always load containers
+        lazy = {}
+        if not isinstance(p, AsyncPromisePipeline):
+            lazy = {name: self._fields.get(name).proxy(p.db, key) for name in field_names if name in self._lazy_fields}
+        containers = {name: loader(name)(p, key, name) for name in field_names if name not in self._hash_fields and name not in lazy}
+        # refresh the ttl in the same pipeline
+        self._queue_refresh(p)
+        return hash_names, hash_values, containers, lazy, self._queue_exists(p, hash_names, hash_values)
+
+    def _queue_refresh(self, p):
+        # reset the ttl of loaded objects with Meta.sliding_ttl
+        if self._meta.get('sliding_ttl') and self._meta.get('ttl') is not None:
+            self._queue_expire(p, seconds(self._meta['ttl']))
+
+    def _queue_exists(self, p, hash_names, hash_values):
+        '''Returns a promise whose value is falsy if the object doesn't exist.
+        The reply to HGETALL or a blob GET is already empty for missing objects,
+        so EXISTS is only sent when a subset of the hash fields is read with HMGET, or none are read.
+        '''
+        if hash_names and (self._meta.get('blob') or len(hash_names) == len(self._hash_fields)):
+            return hash_values
+        return p.exists(self.redis_key)
+
+    def _apply_load(self, queued):
+        def py_value(field_name, value):
+            fn = self._fields.get(field_name).from_db
+            return fn(value)
 
         # dereference the promises
+        hash_names, hash_values, containers, lazy, exists = queued
+        values = self._hash_values(hash_names, hash_values.value) if hash_values is not None else {}
+        values.update({k: v.value for k, v in containers.items()})
+
         # filter Nones and cast from db
-        values = {k: py_value(k, v.value) for k, v in values.items() if v.value is not None}
+        values = {k: py_value(k, v) for k, v in values.items() if v is not None}
+        if self._version_field in hash_names and self._version_field not in values:
+            # record that the version is unset rather than not loaded, see save
+            values[self._version_field] = None
+        if self._meta.get('blob'):
+            # blobs are written whole, so record which fields were read but unset
+            values.update({k: None for k in hash_names if k not in values})
+        values.update(lazy)
+        self._set_loaded(values, bool(exists.value))
+        return values
+
+    @classmethod
+    def _queue_hash(cls, p, key, names):
+        blob = cls._meta.get('blob')
+        if blob:
+            return p.get(key)
+        if len(names) == len(cls._hash_fields):
+            return p.hgetall(key)
+        return p.hmget(key, names)
 
+    @classmethod
+    def _hash_values(cls, names, value):
+        '''Returns the stored values of names from the reply to _queue_hash.
+        '''
+        blob = cls._meta.get('blob')
+        if blob:
+            values = blob.loads(value) if value is not None else {}
+        elif isinstance(value, dict):
+            values = value
+        else:
+            return dict(zip(names, value))
+        # hgetall may return fields that are no longer part of the model
+        keys = cls._hash_keys
+        return {keys[k]: v for k, v in values.items() if k in keys and keys[k] in names}
+
+    def _set_loaded(self, values, exists=True):
+        # values from redis are already the right types
         for k,v in values.items():
-            setattr(self, k, v)
+            if v is None or self._fields[k].plain_set:
+                self._data[k] = v
+            else:
+                setattr(self, k, v)
+        if values:
+            self._mark_clean(values.keys())
+        # containers and lazy proxies have values even if the hash doesn't exist
+        self._persisted = exists
 
     def validate(self, field_names):
-        schema = {k:v for k,v in self._schema.items() if k in field_names}
-        data = {k:v for k,v in self._data.items() if k in field_names}
-        validator = self.Validator(schema)
-        document = validator.normalized(data)
-        if not validator(document):
-            raise ValueError(str(validator.errors))
+        # lazy containers write their changes immediately
+        field_names = frozenset(k for k in field_names if not isinstance(self._data.get(k), LazyContainer))
+        # unset blob fields are recorded as None, see _mark_clean, only assigned Nones are validated
+        data = {k:v for k,v in self._data.items() if k in field_names and (v is not None or (self._dirty and k in self._dirty))}
+        span = Span('validate', self.__class__, field_names) if tracers else None
+        if field_names <= self._fast_fields.keys():
+            document = self._validate_fast(field_names, data)
+        else:
+            cache = self._validator_cache
+            with cache.lock:
+                validator = cache.get(field_names, lambda: self.Validator({k:v for k,v in self._schema.items() if k in field_names}))
+                document = validator.normalized(data)
+                if not validator(document):
+                    raise ValueError(str(validator.errors))
+        if span:
+            span.mark('validate')
+            span.finish()
         return document
 
-    def save(self, db, *fields):
-        def redis_key():
-            primary_field = self._fields.get(self.primary_key())
-            id_ = primary_field.type.to_db(self.id)
-            return self.key(id_)
+    def _validate_fast(self, field_names, data):
+        # mirror the cerberus type, required and nullable rules and messages
+        errors = {}
+        for name in field_names:
+            included, excluded, required, nullable = self._fast_fields[name]
+            if name not in data:
+                if required:
+                    errors[name] = ['required field']
+                continue
+            value = data[name]
+            if value is None:
+                if not nullable:
+                    errors[name] = ['null value not allowed']
+            elif not isinstance(value, included) or isinstance(value, excluded):
+                errors[name] = [f'must be of {self._schema[name]["type"]} type']
+        self._validator_cache.fast += 1
+        if errors:
+            raise ValueError(str(errors))
+        return data
+
+    def save(self, db, *fields, check_version=False, ttl=None):
+        '''Save the specified fields.
+        If no fields are specified, objects that have been loaded or saved only save their
+        modified fields, otherwise every field is saved.
+        With check_version, ConflictError is raised instead of saving if the stored version
+        no longer matches the object's, ie. another client has saved it since it was loaded.
+        ttl overrides Meta.ttl, the hash and container keys are expired in the same transaction.
+        '''
+        field_names = self._save_field_names(*fields)
+        if not field_names:
+            return
+        if check_version:
+            version_field = self._get_version_check()
+            if not self.save_if(db, version_field, self._data.get(version_field.name), *fields, ttl=ttl):
+                raise ConflictError(f'{self.redis_key} has been modified')
+            return
+
+        span = Span('save', self.__class__, field_names) if tracers else None
+
+        # normalise and validate
+        data = self.validate(field_names)
+        if span:
+            span.mark('validate')
+        nodes, versions = self._write_many(db, [(self, field_names, data)], ttl, span=span)
+        self._mark_saved(field_names, versions[0])
+        if span:
+            span.finish(*chain.from_iterable(nodes))
+
+    def _save_field_names(self, *fields):
+        if fields or not self._persisted:
+            field_names = self._field_names(*fields)
+        else:
+            field_names = self.dirty_fields
+        # blobs are always written whole
+        if self._meta.get('blob') and self._hash_fields & field_names:
+            # so fields which were never loaded or assigned would be lost,
+            # unless the object is new and is being saved as a whole
+            unknown = self._hash_fields - self._data.keys()
+            if unknown and (fields or self._persisted):
+                raise ValueError(f'{", ".join(sorted(unknown))} must be loaded or assigned before saving {self.redis_key}')
+            field_names = self._hash_fields | field_names
+        return field_names
+
+    def _queue_indexed(self, p, field_names):
+        # snapshots may be stale, so the stored values are always read
+        # sorted set entries are replaced by ZADD, so only set entries need their stored value
+        names = [name for name in field_names if name in self._index_fields and self._fields[name].type.score is None]
+        if names:
+            return names, self._queue_hash(p, self.redis_key, names)
+
+    def _apply_indexed(self, queued):
+        values = {}
+        if queued:
+            names, promise = queued
+            stored = self._hash_values(names, promise.value)
+            values.update({k: self._fields.get(k).from_db(v) for k, v in stored.items() if v is not None})
+        return values
+
+    def _queue_index(self, p, data, field_names, previous):
+        id = self._db_id
+        for name in self._index_fields.intersection(field_names):
+            field = self._fields.get(name)
+            value, old = data.get(name), previous.get(name)
+            # None values aren't written, so they remain in their old index
+            if value is None:
+                continue
+            if field.type.score is None:
+                if value == old:
+                    continue
+                if old is not None:
+                    field.remove_index(p, id, old)
+            field.add_index(p, id, value)
+
+    def _queue_save(self, p, data, field_names, previous=None, ttl=None):
         def saver(field_name):
             return self._fields.get(field_name).save
+        def updater(field_name):
+            return self._fields.get(field_name).update
         def db_value(field_name, value):
             fn = self._fields.get(field_name).to_db
             return fn(value)
 
         key = self.redis_key
-        field_names = {field.name for field in fields} if fields else self._schema.keys()
-        # normalise and validate
-        data = self.validate(field_names)
-
-        p = PromisePipeline(db, transaction=True)
-        for field_name in field_names:
-            value = data.get(field_name)
-            if value is None:
+        values = {k: db_value(k, data[k]) for k in field_names if data.get(k) is not None}
+        originals = self._original or {}
+
+        # hash fields are written with a single command
+        # the version field is only ever incremented
+        mapping = {k: v for k, v in values.items() if k in self._hash_fields and k != self._version_field}
+        if mapping:
+            blob = self._meta.get('blob')
+            if blob:
+                p.set(key, blob.dumps(mapping))
+            else:
+                p.hset(key, mapping=mapping)
+        version = p.hincrby(key, self._version_field, 1) if self._version_field else None
+        containers = []
+        for field_name, value in values.items():
+            if field_name in self._hash_fields:
                 continue
-            value = db_value(field_name, value)
+            containers.append(self._fields.get(field_name).key(key))
+            # send the changes rather than the entire container where possible
+            original = originals.get(field_name)
+            if original is not None:
+                original = db_value(field_name, original)
+                if updater(field_name)(p, key, field_name, value, original):
+                    continue
             saver(field_name)(p, key, field_name, value)
-        p.execute()
+
+        if previous is not None:
+            self._queue_index(p, data, field_names, previous)
+
+        # containers which weren't saved are expired too, so they don't outlive the hash
+        if ttl is not None:
+            # objects of the model can now have a ttl without Meta.ttl, see Meta.keep_ttl
+            self._meta['keep_ttl'] = True
+        ttl = self._meta.get('ttl') if ttl is None else ttl
+        if ttl is not None:
+            self._queue_expire(p, seconds(ttl))
+        elif containers and self._meta.get('keep_ttl'):
+            # containers which were emptied and written again have lost their ttl,
+            # so they are given the hash's remaining ttl
+            p.script(KEEP_TTL, [key, *containers])
+        return version
+
+    def _queue_expire(self, p, ttl):
+        key = self.redis_key
+        p.expire(key, ttl)
+        for name in self._fields.keys() - self._hash_fields:
+            p.expire(self._fields.get(name).key(key), ttl)
 
     def delete(self, db):
+        span = Span('delete', self.__class__) if tracers else None
+        p = self._delete_many(db, [self], span)
+        self._mark_deleted()
+        if span:
+            span.finish(p)
+
+    def _queue_delete(self, p, previous=None):
         def deleter(field_name):
             return self._fields.get(field_name).delete
 
         key = self.redis_key
         field_names = self._schema.keys()
 
-        p = PromisePipeline(db)
+        previous = previous or {}
+        for name in self._index_fields:
+            field = self._fields.get(name)
+            # sorted set entries are removed by id alone
+            if field.type.score is None and previous.get(name) is None:
+                continue
+            field.remove_index(p, self._db_id, previous.get(name))
+
         # delete each field incase they have a custom deleter
         # then delete ourself
         for name in field_names:
             deleter(name)(p, key, name)
         p.delete(key)
-        p.execute()
+
+    def incr(self, db, field, amount=1):
+        '''Increment an Integer, Float or Number field on the server with HINCRBY/HINCRBYFLOAT,
+        updating its range index and version field in the same script.
+        The new value and version are assigned to the object and the value is returned.
+        Only the field's type is validated, other rules such as max are not applied.
+        '''
+        keys, args = self._queue_incr(field, amount)
+        value = self._apply_incr(field, INCR(db, keys, args))
+        if self._meta.get('hash_tags') and field.name in self._index_fields:
+            field.add_index(db, self._db_id, value)
+        return value
+
+    def _queue_incr(self, field, amount):
+        if field.name not in self._hash_fields or not isinstance(field.type, (Integer, Float, Number)):
+            raise TypeError(f'{field.name} is not an Integer, Float or Number field')
+        if self._meta.get('blob') or field.encode != field.type.to_db:
+            raise TypeError(f'{field.name} must be stored as text to be incremented')
+        command = 'HINCRBY' if isinstance(field.type, Integer) else 'HINCRBYFLOAT'
+        keys = [self.redis_key]
+        # with hash tags the index is in another slot, so it is updated after the script
+        if field.name in self._index_fields and not self._meta.get('hash_tags'):
+            keys.append(field.index_key())
+        args = [command, field.name, amount, self._db_id]
+        if self._version_field:
+            args.append(self._version_field)
+        return keys, args
+
+    def _apply_incr(self, field, reply):
+        field_names = {field.name}
+        self._data[field.name] = field.from_db(reply[0])
+        if self._version_field:
+            self._data[self._version_field] = int(reply[1])
+            field_names.add(self._version_field)
+        self._mark_saved(field_names)
+        return self._data[field.name]
+
+    def compare_and_set(self, db, field, expected, value):
+        '''Set a hash field to value only if its stored value equals expected, which is None
+        if the field must be unset. The check and write are made atomically by a script.
+        Returns True if the value was written, otherwise the object is left unchanged.
+        '''
+        saved, version = False, None
+        restore = self._data.get(field.name), field.name in (self._dirty or ())
+        try:
+            setattr(self, field.name, value)
+            commands, version, index = self._queue_compare_and_set(field, expected)
+            saved = commands.execute(db)
+            if saved:
+                self._write_index(db, index)
+        finally:
+            self._apply_compare_and_set(field, saved, restore, version)
+        return saved
+
+    def _queue_compare_and_set(self, field, expected):
+        if getattr(self, field.name) is None:
+            raise ValueError(f'{field.name} can not be set to None')
+        data = self.validate({field.name})
+        # the expected value is the stored value, so it is also the value to remove from the index
+        previous = {field.name: expected} if expected is not None else {}
+        return self._queue_if_equal(field, expected, data, {field.name}, previous)
+
+    def _apply_compare_and_set(self, field, saved, restore, version):
+        if saved:
+            self._mark_saved({field.name}, version)
+            return
+        value, dirty = restore
+        self._data[field.name] = value
+        if not dirty and self._dirty:
+            self._dirty.discard(field.name)
+            if not self._dirty:
+                self._dirty = None
+
+    def save_if(self, db, field, expected, *fields, ttl=None):
+        '''Save as with save, but only if the stored value of a hash field equals expected,
+        which is None if the field must be unset. The check and writes are made atomically by a script.
+        Returns True if the object was saved.
+        '''
+        field_names = self._save_field_names(*fields)
+        data = self.validate(field_names)
+        previous = self._read_indexed(db, [(self, field_names)])[0]
+        commands, version, index = self._queue_if_equal(field, expected, data, field_names, previous, ttl)
+        if not commands.execute(db):
+            return False
+        self._write_index(db, index)
+        self._mark_saved(field_names, version)
+        return True
+
+    def _queue_if_equal(self, field, expected, data, field_names, previous, ttl=None):
+        '''Record the commands to save field_names if the stored value of field equals expected.
+        Returns the commands, the version promise and, with hash tags, the index updates to
+        make after the script as indexes are in other slots.
+        '''
+        if field.name not in self._hash_fields:
+            raise TypeError(f'{field.name} is not a hash field')
+        if self._meta.get('blob'):
+            raise TypeError('Conditional saves are not supported with Meta.blob')
+        commands = ScriptCommands(self.redis_key, field.name, None if expected is None else field.to_db(expected))
+        if self._meta.get('hash_tags'):
+            return commands, self._queue_save(commands, data, field_names, None, ttl), (data, field_names, previous)
+        return commands, self._queue_save(commands, data, field_names, previous, ttl), None
+
+    def _write_index(self, db, index):
+        if index:
+            p = PromisePipeline(db)
+            self._queue_index(p, *index)
+            if p.commands:
+                p.execute()
 
     def __str__(self):
         return f"<class '{__name__}.{self.__class__.__name__}'>"
@@ -391,3 +1552,38 @@ class Model(object, metaclass=ModelMeta):
         values = {k:self._data.get(k) for k in self._fields.keys()}
         args = ', '.join(f'{k}={v}' for k,v in values.items())
         return f'{self.__class__.__name__}({args})'
+
+
+class Reference(Type):
+    '''A reference to an object of another model, stored as its primary key.
+    model is the Model or its name, for models which are declared later.
+    Values are objects of the model, ids are converted to objects. Referenced objects are
+    only loaded when requested with include=..., otherwise only their primary key is set.
+    '''
+    schema = {'type': 'reference'}
+    types_mapping = {'reference': TypeDefinition('reference', (Model,), ())}
+
+    def __init__(self, model, **kwargs):
+        super().__init__(**kwargs)
+        self._model = model
+
+    @property
+    def model(self):
+        if isinstance(self._model, str):
+            self._model = models[self._model]
+        return self._model
+
+    def to_db(self, value):
+        # ids are accepted too, ie. find_ids(author='abc')
+        return self.set(None, value)._db_id
+
+    def from_db(self, value):
+        primary_field = self.model._fields.get(self.model.primary_key())
+        return self.model.trusted(**{primary_field.name: primary_field.type.from_db(value)})
+
+    def set(self, instance, value):
+        if value is None or isinstance(value, Model):
+            if value is not None and not isinstance(value, self.model):
+                raise TypeError(f'{value.__class__.__name__} is not a {self.model.__name__}')
+            return value
+        return self.model.trusted(**{self.model.primary_key(): value})
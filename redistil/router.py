@@ -0,0 +1,153 @@
+__all__ = ['Router']
+
+import asyncio
+from time import monotonic, perf_counter
+from inspect import isawaitable
+from itertools import count
+from threading import Lock
+
+# commands which can be served by replicas
+READ_COMMANDS = frozenset((
+    'exists', 'get', 'mget', 'strlen', 'type', 'ttl', 'pttl',
+    'hget', 'hgetall', 'hmget', 'hexists', 'hlen', 'hkeys', 'hvals', 'hscan', 'hscan_iter',
+    'lrange', 'lindex', 'llen', 'lpos',
+    'smembers', 'sismember', 'smismember', 'scard', 'sscan', 'sscan_iter',
+    'zrange', 'zrangebyscore', 'zrevrange', 'zrevrangebyscore', 'zscore', 'zcard', 'zcount', 'zscan', 'zscan_iter',
+    'scan', 'scan_iter',
+))
+# ttl refreshes made by loads with Meta.sliding_ttl, sent to the primary in their own pipeline
+# without counting as writes, so the rest of the load can still be served by a replica
+REFRESH_COMMANDS = frozenset(('expire', 'pexpire'))
+# sent to the primary without counting as writes
+PRIMARY_COMMANDS = frozenset(('pubsub', 'client', 'ping', 'info', 'script_load', 'script_exists', 'close', 'aclose'))
+
+class Router:
+    '''Sends reads to replicas and everything else to the primary.
+    Pass it wherever a Redis client is accepted, all of the clients must be sync or all async.
+    Pipelines are routed when executed, those containing only reads go to a replica,
+    so loads, find_by, range and iteration are served by replicas, while saves and deletes go to the primary.
+    The ttl refreshes of loads with Meta.sliding_ttl are split into a pipeline sent to the primary,
+    which isn't counted as a write by read_your_writes.
+
+    strategy is 'round_robin', or 'latency' which picks the replica with the lowest moving average
+    pipeline latency.
+    read_your_writes pins every read to the primary for that many seconds after a write,
+    so objects are read back as they were written despite replication lag.
+    '''
+    def __init__(self, primary, replicas=(), strategy='round_robin', read_your_writes=0, latency_weight=0.2):
+        if strategy not in ('round_robin', 'latency'):
+            raise ValueError(f'Unknown strategy {strategy}')
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.read_your_writes = read_your_writes
+        self.latency_weight = latency_weight
+        # moving average of each replica's pipeline latency in seconds
+        self.latencies = [0.0] * len(self.replicas)
+        self.lock = Lock()
+        self.counter = count()
+        self.pinned_until = 0.0
+
+    def pipeline(self, **kwargs):
+        return RoutedPipeline(self, kwargs)
+
+    def __getattr__(self, name):
+        if name in READ_COMMANDS:
+            return getattr(self.read_client()[0], name)
+        attr = getattr(self.primary, name)
+        if not callable(attr) or name in PRIMARY_COMMANDS:
+            return attr
+        def write(*args, **kwargs):
+            self.written()
+            return attr(*args, **kwargs)
+        return write
+
+    def read_client(self):
+        '''Returns the client to read from and the index of the replica, None for the primary.
+        '''
+        if not self.replicas or monotonic() < self.pinned_until:
+            return self.primary, None
+        if self.strategy == 'latency':
+            index = min(range(len(self.replicas)), key=self.latencies.__getitem__)
+        else:
+            index = next(self.counter) % len(self.replicas)
+        return self.replicas[index], index
+
+    def written(self):
+        if self.read_your_writes:
+            self.pinned_until = monotonic() + self.read_your_writes
+
+    def measured(self, index, start):
+        if index is None:
+            return
+        elapsed = perf_counter() - start
+        with self.lock:
+            latency = self.latencies[index]
+            self.latencies[index] = elapsed if not latency else latency + (elapsed - latency) * self.latency_weight
+
+
+class RoutedPipeline:
+    '''Records commands, then sends them to a replica if they are all reads, otherwise to the primary.
+    '''
+    def __init__(self, router, kwargs):
+        self.router = router
+        self.kwargs = kwargs
+        self.command_stack = []
+        # the primary's pipeline, once keys are watched
+        self.watching = None
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.command_stack.append((name, args, kwargs))
+            return self
+        return record
+
+    def watch(self, *keys):
+        # WATCH holds the connection the transaction is sent on, so it's made on the primary now
+        self.watching = self.router.primary.pipeline(**self.kwargs)
+        return self.watching.watch(*keys)
+
+    def multi(self):
+        self.watching.multi()
+
+    def execute(self, raise_on_error=True):
+        router = self.router
+        commands = self.command_stack
+        if self.kwargs.get('transaction') or any(name not in READ_COMMANDS and name not in REFRESH_COMMANDS for name, _, _ in commands):
+            router.written()
+            return self._execute(router.primary, None, commands, raise_on_error)
+
+        if commands and all(name in REFRESH_COMMANDS for name, _, _ in commands):
+            return self._execute(router.primary, None, commands, raise_on_error)
+        client, index = router.read_client()
+        if index is None or not any(name in REFRESH_COMMANDS for name, _, _ in commands):
+            return self._execute(client, index, commands, raise_on_error)
+        reads = self._execute(client, index, [command for command in commands if command[0] not in REFRESH_COMMANDS], raise_on_error)
+        refreshes = self._execute(router.primary, None, [command for command in commands if command[0] in REFRESH_COMMANDS], raise_on_error)
+        if isawaitable(reads):
+            return self._merge_async(reads, refreshes)
+        return self._merge(reads, refreshes)
+
+    def _execute(self, client, index, commands, raise_on_error=True):
+        pipeline = self.watching if self.watching is not None else client.pipeline(**self.kwargs)
+        for name, args, kwargs in commands:
+            getattr(pipeline, name)(*args, **kwargs)
+        start = perf_counter()
+        values = pipeline.execute(raise_on_error=raise_on_error)
+        if isawaitable(values):
+            return self._measure_async(values, index, start)
+        self.router.measured(index, start)
+        return values
+
+    async def _measure_async(self, values, index, start):
+        values = await values
+        self.router.measured(index, start)
+        return values
+
+    def _merge(self, reads, refreshes):
+        # the replies in the order the commands were queued
+        reads, refreshes = iter(reads), iter(refreshes)
+        return [next(refreshes) if name in REFRESH_COMMANDS else next(reads) for name, _, _ in self.command_stack]
+
+    async def _merge_async(self, reads, refreshes):
+        return self._merge(*await asyncio.gather(reads, refreshes))
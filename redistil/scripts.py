@@ -0,0 +1,167 @@
+__all__ = ['Script']
+
+from hashlib import sha1
+from redis.exceptions import NoScriptError
+from .pipeline import Promise
+
+class Script:
+    '''Lua script run with EVALSHA.
+    The SHA is calculated once and the source is only sent with SCRIPT LOAD when
+    the server doesn't know the script, ie. the first time it's used or after a restart.
+    '''
+    def __init__(self, source):
+        self.source = source
+        self.sha = sha1(source.encode('utf-8')).hexdigest()
+
+    def __call__(self, db, keys=(), args=()):
+        try:
+            return db.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            db.script_load(self.source)
+            return db.evalsha(self.sha, len(keys), *keys, *args)
+
+    async def call_async(self, db, keys=(), args=()):
+        try:
+            return await db.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await db.script_load(self.source)
+            return await db.evalsha(self.sha, len(keys), *keys, *args)
+
+    def load(self, db):
+        '''Register the script ahead of its first use.
+        '''
+        return db.script_load(self.source)
+
+
+class ScriptCommands:
+    '''Records the commands queued by Model._queue_save so RUN_IF_EQUAL can run them
+    only if the stored value of a hash field equals expected, which is None if it must be unset.
+    Like PromisePipeline each command returns a promise, which is set by execute.
+    Commands are passed as their name, number of keys, number of arguments and arguments,
+    the keys are collected separately in order so they can be declared to the script.
+    '''
+    def __init__(self, key, field, expected):
+        self.keys = [key]
+        self.args = [field, 0, ''] if expected is None else [field, 1, expected]
+        self.promises = []
+
+    def _record(self, command, keys, args):
+        self.keys.extend(keys)
+        self.args += [command, len(keys), len(args), *args]
+        self.promises.append(Promise())
+        return self.promises[-1]
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        args = [] if field is None else [field, value]
+        for k, v in (mapping or {}).items():
+            args += [k, v]
+        return self._record('HSET', [key], args)
+
+    def zadd(self, key, mapping):
+        args = []
+        for member, score in mapping.items():
+            args += [score, member]
+        return self._record('ZADD', [key], args)
+
+    def delete(self, *keys):
+        return self._record('DEL', keys, [])
+
+    def rename(self, src, dst):
+        return self._record('RENAME', [src, dst], [])
+
+    def script(self, script, keys=(), args=()):
+        # scripts can't call scripts, KEEP_TTL is run by RUN_IF_EQUAL itself
+        if script is not KEEP_TTL:
+            raise TypeError('Only KEEP_TTL can be run by a conditional save')
+        return self._record('KEEPTTL', keys, args)
+
+    def __getattr__(self, name):
+        # every other command takes a single key followed by its arguments
+        def record(key, *args):
+            return self._record(name.upper(), [key], args)
+        return record
+
+    def execute(self, db):
+        '''Returns True if the check passed and the commands were run.
+        '''
+        return self._resolve(RUN_IF_EQUAL(db, self.keys, self.args))
+
+    async def execute_async(self, db):
+        return self._resolve(await RUN_IF_EQUAL.call_async(db, self.keys, self.args))
+
+    def _resolve(self, values):
+        if values is None:
+            return False
+        for promise, value in zip(self.promises, values):
+            promise.set(value)
+        return True
+
+
+# KEYS[1] is the key whose ttl is copied onto the other keys, if it has one
+# returns the ttl in milliseconds
+KEEP_TTL = Script('''
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then
+    for i = 2, #KEYS do
+        redis.call('PEXPIRE', KEYS[i], ttl)
+    end
+end
+return ttl
+''')
+
+# KEYS[1] is the object's hash, any further keys are consumed by the commands in order
+# ARGV is the field, '1' if it must equal the expected value or '0' if it must be unset,
+# the expected value, then the commands recorded by ScriptCommands
+# KEEPTTL does the same as KEEP_TTL, copying the ttl of its first key onto the others
+# returns nil if the check failed, otherwise the reply to each command
+RUN_IF_EQUAL = Script('''
+local current = redis.call('HGET', KEYS[1], ARGV[1])
+if ARGV[2] == '1' then
+    if current ~= ARGV[3] then
+        return false
+    end
+elseif current then
+    return false
+end
+local replies = {}
+local k = 2
+local i = 4
+while i <= #ARGV do
+    local nkeys, nargs = tonumber(ARGV[i + 1]), tonumber(ARGV[i + 2])
+    local command = {ARGV[i]}
+    for j = 1, nkeys do
+        command[#command + 1] = KEYS[k]
+        k = k + 1
+    end
+    for j = 1, nargs do
+        command[#command + 1] = ARGV[i + 2 + j]
+    end
+    if command[1] == 'KEEPTTL' then
+        local ttl = redis.call('PTTL', command[2])
+        if ttl > 0 then
+            for j = 3, #command do
+                redis.call('PEXPIRE', command[j], ttl)
+            end
+        end
+        replies[#replies + 1] = ttl
+    else
+        replies[#replies + 1] = redis.call(unpack(command))
+    end
+    i = i + 3 + nargs
+end
+return replies
+''')
+
+# KEYS[1] is the object's hash, KEYS[2] the field's range index if it is indexed
+# ARGV is HINCRBY or HINCRBYFLOAT, the field, the amount, the object's id and the version field if it has one
+# returns the new value, followed by the new version if the version field is set
+INCR = Script('''
+local value = redis.call(ARGV[1], KEYS[1], ARGV[2], ARGV[3])
+if KEYS[2] then
+    redis.call('ZADD', KEYS[2], value, ARGV[4])
+end
+if ARGV[5] then
+    return {value, redis.call('HINCRBY', KEYS[1], ARGV[5], 1)}
+end
+return {value}
+''')
@@ -0,0 +1,200 @@
+__all__ = ['Session', 'AsyncSession']
+
+from .redistil import Model, retry_watched
+from .aio import AsyncModel, retry_watched as retry_watched_async
+from .pipeline import PromisePipeline, AsyncPromisePipeline
+
+class Session:
+    '''Unit of work with an identity map.
+    Each object is loaded at most once per session and the same instance is returned every time.
+    Saves and deletes of objects of any model are queued and written in a single transaction
+    when the session is flushed, which happens when the with block exits without an exception.
+    Adding an object more than once writes each field once, with its value at the time of the flush.
+
+        with Session(db) as session:
+            users = session.prefetch(User, ids)
+            user = session.get(User, 'abc')
+            user.visits += 1
+            session.add(user)
+
+    Objects are validated before anything is written. Version checks aren't supported.
+    A transaction's keys must share a slot in Redis Cluster, so sessions can't span hash tagged objects.
+    '''
+    model = Model
+    pipeline = PromisePipeline
+
+    def __init__(self, db, ttl=None):
+        self.db = db
+        self.ttl = ttl
+        # redis key -> object
+        self.identity = {}
+        # redis key -> names of the fields loaded or set by the session
+        self.loaded = {}
+        # redis keys of objects which don't exist
+        self.missing = set()
+        # redis key -> (object, {name: field}, save dirty fields), in the order they were added
+        self.saves = {}
+        # redis key -> object
+        self.deletes = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # discard the queued writes if the block failed
+        if exc_type is None:
+            self.flush()
+        else:
+            self.saves.clear()
+            self.deletes.clear()
+
+    def get(self, model, id, *fields):
+        '''Returns the object with the id, or None if it doesn't exist.
+        '''
+        return self.prefetch(model, [id], *fields)[0]
+
+    def prefetch(self, model, ids, *fields):
+        '''Load the objects with the ids in a single pipeline, skipping those already in the session.
+        Objects in the session which haven't loaded some of the fields load only those fields,
+        fields modified since they were loaded aren't overwritten.
+        Returns the objects in the same order as ids, None for objects which don't exist.
+        '''
+        objs = [self._identity(model(**{model.primary_key(): id})) for id in ids]
+        p = self.pipeline(self.db)
+        queued = self._queue_prefetch(p, objs, *fields)
+        if queued:
+            p.execute()
+        return self._apply_prefetch(objs, queued)
+
+    def add(self, obj, *fields):
+        '''Queue saving the fields, or the dirty fields if none are specified, see Model.save.
+        '''
+        key = self._attach(obj)
+        self.deletes.pop(key, None)
+        if not obj._persisted:
+            # new objects aren't loaded
+            self.loaded[key] = set(obj._schema.keys())
+        _, queued, dirty = self.saves.get(key, (obj, {}, False))
+        self.saves[key] = obj, {**queued, **{field.name: field for field in fields}}, dirty or not fields
+
+    def delete(self, obj):
+        '''Queue deleting the object, discarding any queued saves.
+        '''
+        key = self._attach(obj)
+        self.saves.pop(key, None)
+        self.deletes[key] = obj
+
+    def flush(self):
+        '''Write the queued saves and deletes in a single transaction.
+        '''
+        queued, deletes = self._validate()
+        if not queued and not deletes:
+            return
+        def write():
+            p = self.pipeline(self.db, transaction=True)
+            indexed = self.model._read_indexed(self.db, self._indexed(queued, deletes), p)
+            versions = self._queue_flush(p, queued, deletes, indexed)
+            p.execute()
+            return versions
+        self._apply_flush(queued, deletes, retry_watched(write))
+
+    def _identity(self, obj):
+        # the object already in the session with the same key
+        return self.identity.setdefault(obj.redis_key, obj)
+
+    def _attach(self, obj):
+        if obj.redis_key in self.missing:
+            # objects which don't exist can be replaced by new objects
+            self.missing.discard(obj.redis_key)
+            self.identity[obj.redis_key] = obj
+        if self._identity(obj) is not obj:
+            raise ValueError(f'{obj.redis_key} is already in the session as another object')
+        return obj.redis_key
+
+    def _queue_prefetch(self, p, objs, *fields):
+        queued = {}
+        for obj in objs:
+            key = obj.redis_key
+            if key in queued or key in self.missing:
+                continue
+            field_names = obj._field_names(*fields) - self.loaded.get(key, set()) - obj.dirty_fields
+            if field_names:
+                queued[key] = obj, field_names, obj._queue_load(p, field_names)
+        return list(queued.values())
+
+    def _apply_prefetch(self, objs, queued):
+        for obj, field_names, values in queued:
+            obj._apply_load(values)
+            self.loaded.setdefault(obj.redis_key, set()).update(field_names)
+            if not obj._persisted and obj.redis_key not in self.saves:
+                self.missing.add(obj.redis_key)
+        return [None if obj.redis_key in self.missing or obj.redis_key in self.deletes else obj for obj in objs]
+
+    def _validate(self):
+        queued = []
+        for obj, fields, dirty in self.saves.values():
+            field_names = set(obj._save_field_names(*fields.values())) if fields else set()
+            if dirty:
+                field_names.update(obj._save_field_names())
+            if field_names:
+                queued.append((obj, field_names, obj.validate(field_names)))
+        return queued, list(self.deletes.values())
+
+    def _indexed(self, queued, deletes):
+        return [(obj, field_names) for obj, field_names, data in queued] + [(obj, obj._index_fields) for obj in deletes]
+
+    def _queue_flush(self, p, queued, deletes, indexed):
+        versions = [obj._queue_save(p, data, field_names, previous, self.ttl) for (obj, field_names, data), previous in zip(queued, indexed)]
+        for obj, previous in zip(deletes, indexed[len(queued):]):
+            obj._queue_delete(p, previous)
+        return versions
+
+    def _apply_flush(self, queued, deletes, versions):
+        for (obj, field_names, data), version in zip(queued, versions):
+            obj._mark_saved(field_names, version)
+            self.missing.discard(obj.redis_key)
+        for obj in deletes:
+            obj._mark_deleted()
+            self.missing.add(obj.redis_key)
+        self.saves.clear()
+        self.deletes.clear()
+
+
+class AsyncSession(Session):
+    '''Session for AsyncModel objects, use with async with.
+    '''
+    model = AsyncModel
+    pipeline = AsyncPromisePipeline
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
+        else:
+            self.saves.clear()
+            self.deletes.clear()
+
+    async def get(self, model, id, *fields):
+        return (await self.prefetch(model, [id], *fields))[0]
+
+    async def prefetch(self, model, ids, *fields):
+        objs = [self._identity(model(**{model.primary_key(): id})) for id in ids]
+        p = self.pipeline(self.db)
+        queued = self._queue_prefetch(p, objs, *fields)
+        if queued:
+            await p.execute()
+        return self._apply_prefetch(objs, queued)
+
+    async def flush(self):
+        queued, deletes = self._validate()
+        if not queued and not deletes:
+            return
+        async def write():
+            p = self.pipeline(self.db, transaction=True)
+            indexed = await self.model._read_indexed(self.db, self._indexed(queued, deletes), p)
+            versions = self._queue_flush(p, queued, deletes, indexed)
+            await p.execute()
+            return versions
+        self._apply_flush(queued, deletes, await retry_watched_async(write))
@@ -0,0 +1,139 @@
+__all__ = ['WriteBehind']
+
+from time import monotonic
+from threading import Thread, Condition
+from .redistil import chunks
+
+class WriteBehind:
+    '''Buffers saves and writes them from a background thread.
+    Saves of the same object are merged, so a field updated many times between writes is written once,
+    with its latest value. The buffer is written when it holds batch_size objects or interval seconds
+    after it was last written, in a transaction per model of at most batch_size objects.
+
+    Objects are validated and marked as saved by save, before they are written.
+    Their Meta.cache entries are invalidated after they are written.
+    save blocks while max_pending objects are buffered, flush blocks until everything saved before it
+    has been written, close writes anything buffered and stops the thread.
+    An error writing a batch discards it and is raised by the next flush or close.
+    Version fields are incremented but the new version isn't assigned to objects.
+    '''
+    def __init__(self, db, interval=0.05, batch_size=1000, max_pending=10000, ttl=None):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.condition = Condition()
+        # redis key -> (object holding the values to write, field names)
+        self.pending = {}
+        # flush() increments requested, the writer sets written to the request its batch covered
+        self.requested = 0
+        self.written = 0
+        self.error = None
+        self.closed = False
+        self.thread = Thread(target=self._run, name='redistil-write-behind', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def save(self, obj, *fields, timeout=None):
+        '''Buffer saving the fields, or the dirty fields if none are specified, see Model.save.
+        Raises TimeoutError if the buffer is still full after timeout seconds.
+        '''
+        field_names = obj._save_field_names(*fields)
+        if not field_names:
+            return
+        data = obj.validate(field_names)
+        key = obj.redis_key
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('WriteBehind is closed')
+            if key not in self.pending and len(self.pending) >= self.max_pending:
+                self.condition.notify_all()
+                if not self.condition.wait_for(lambda: len(self.pending) < self.max_pending or self.closed, timeout):
+                    raise TimeoutError('WriteBehind buffer is full')
+                if self.closed:
+                    raise RuntimeError('WriteBehind is closed')
+            shadow, names = self.pending.get(key) or (self._shadow(obj), set())
+            # the stored values of index fields are the values before the first buffered save,
+            # fields which weren't loaded are read when the batch is written
+            originals = {k: v for k, v in (obj._original or {}).items() if k in obj._index_fields and k not in names}
+            if originals:
+                shadow._original = {**(shadow._original or {}), **originals}
+            shadow._data.update(data)
+            self.pending[key] = shadow, names | set(field_names)
+            obj._mark_clean(field_names)
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+
+    def flush(self, timeout=None):
+        '''Wait until every save made before the call has been written.
+        '''
+        with self.condition:
+            self.requested += 1
+            request = self.requested
+            self.condition.notify_all()
+            if not self.condition.wait_for(lambda: self.written >= request or not self.thread.is_alive(), timeout):
+                raise TimeoutError('WriteBehind flush timed out')
+        self._raise()
+
+    def close(self, timeout=None):
+        '''Write anything buffered and stop the writer thread.
+        '''
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join(timeout)
+        self._raise()
+
+    def _raise(self):
+        error, self.error = self.error, None
+        if error:
+            raise error
+
+    def _shadow(self, obj):
+        # holds the values to write, independent of later changes to obj
+        # containers have no original so they are written whole
+        return obj.trusted(**{obj.primary_key(): obj.id})
+
+    def _run(self):
+        while True:
+            with self.condition:
+                deadline = monotonic() + self.interval
+                while not self.closed and self.written >= self.requested and len(self.pending) < self.batch_size:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(remaining)
+                batch, self.pending = self.pending, {}
+                request = self.requested
+                closed = self.closed
+                # wake saves waiting for space
+                self.condition.notify_all()
+
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    self.error = e
+
+            with self.condition:
+                self.written = request
+                self.condition.notify_all()
+                if closed and not self.pending:
+                    return
+
+    def _write(self, batch):
+        models = {}
+        for shadow, field_names in batch.values():
+            models.setdefault(type(shadow), []).append((shadow, field_names))
+        for model, saves in models.items():
+            for chunk in chunks(saves, self.batch_size):
+                model._write_many(self.db, [(shadow, field_names, shadow._data) for shadow, field_names in chunk], self.ttl)
+                # after the write, so a concurrent load can't cache the old values again
+                for shadow, field_names in chunk:
+                    shadow._invalidate_cache()
@@ -0,0 +1,128 @@
+import unittest
+from ipaddress import IPv6Address
+from fakeredis import FakeAsyncRedis
+from redistil import *
+
+class MyAsyncModel(AsyncModel):
+    string = Field(String, primary_key=True)
+    integer = Field(Integer)
+    ipv6address = Field(IPV6Address)
+    set = Set(Integer)
+    list = List(String)
+
+class AsyncIndexedModel(AsyncModel):
+    id = Field(String, primary_key=True)
+    name = Field(String, index=True)
+    age = Field(Integer, index=True)
+
+class TestAsyncModel(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.redis = FakeAsyncRedis()
+
+    async def asyncTearDown(self):
+        await self.redis.flushall()
+        await self.redis.aclose()
+
+    async def test_create_save_load_delete(self):
+        model = await MyAsyncModel.create(self.redis,
+            string='string',
+            integer=1,
+            ipv6address=IPv6Address('::1'),
+            set={1, 2},
+            list=['a', 'b'],
+        )
+        self.assertEqual(await self.redis.hget(model.redis_key, 'integer'), b'1')
+
+        model = await MyAsyncModel.load(self.redis, 'string')
+        self.assertEqual(model.integer, 1)
+        self.assertEqual(model.ipv6address, IPv6Address('::1'))
+        self.assertEqual(model.set, {1, 2})
+        self.assertEqual(model.list, ['a', 'b'])
+
+        model.integer = 2
+        model.list.append('c')
+        await model.save(self.redis)
+        self.assertEqual(await self.redis.hget(model.redis_key, 'integer'), b'2')
+        self.assertEqual(await self.redis.lrange(model.redis_key + '::list', 0, -1), [b'a', b'b', b'c'])
+
+        await model.delete(self.redis)
+        self.assertFalse(await self.redis.exists(model.redis_key))
+        self.assertFalse(await self.redis.exists(model.redis_key + '::list'))
+
+    async def test_many(self):
+        models = [MyAsyncModel(string=str(i), integer=i) for i in range(5)]
+        await MyAsyncModel.save_many(self.redis, models, chunk_size=2)
+
+        loaded = await MyAsyncModel.load_many(self.redis, ['4', 'missing', '0'], MyAsyncModel.integer, chunk_size=2)
+        self.assertEqual([m.integer if m else None for m in loaded], [4, None, 0])
+
+        await MyAsyncModel.delete_many(self.redis, models)
+        self.assertEqual(await self.redis.keys('MyAsyncModel::*'), [])
+
+    async def test_indexes(self):
+        for i, name in enumerate('abcab'):
+            await AsyncIndexedModel.create(self.redis, id=str(i), name=name, age=i * 10)
+        self.assertEqual(await AsyncIndexedModel.find_ids(self.redis, name='a'), ['0', '3'])
+        self.assertEqual(await AsyncIndexedModel.find_ids(self.redis, name='a', age=30), ['3'])
+        models = await AsyncIndexedModel.find_by(self.redis, AsyncIndexedModel.age, name='b')
+        self.assertEqual([m.age for m in models], [10, 40])
+        self.assertEqual(await AsyncIndexedModel.range_ids(self.redis, AsyncIndexedModel.age, 10, 30), ['1', '2', '3'])
+        self.assertEqual(await AsyncIndexedModel.range_ids(self.redis, AsyncIndexedModel.age, 10, limit=2, offset=1), ['2', '3'])
+        models = await AsyncIndexedModel.range(self.redis, AsyncIndexedModel.age, hi=10)
+        self.assertEqual([m.name for m in models], ['a', 'b'])
+        with self.assertRaises(ValueError):
+            await AsyncIndexedModel.range_ids(self.redis, AsyncIndexedModel.name)
+
+    async def test_iter_all(self):
+        await MyAsyncModel.save_many(self.redis, [MyAsyncModel(string=str(i), integer=i, list=['a']) for i in range(5)])
+        ids = [id async for id in MyAsyncModel.iter_all(self.redis, ids_only=True)]
+        self.assertEqual(sorted(ids), ['0', '1', '2', '3', '4'])
+        models = [m async for m in MyAsyncModel.iter_all(self.redis, MyAsyncModel.integer, batch=2)]
+        self.assertEqual(sorted(m.integer for m in models), [0, 1, 2, 3, 4])
+
+    async def test_scripts(self):
+        model = MyAsyncModel(string='a')
+        self.assertEqual(await model.incr(self.redis, MyAsyncModel.integer, 2), 2)
+        self.assertTrue(await model.compare_and_set(self.redis, MyAsyncModel.integer, 2, 3))
+        self.assertFalse(await model.compare_and_set(self.redis, MyAsyncModel.integer, 2, 4))
+        model.list = ['a']
+        self.assertTrue(await model.save_if(self.redis, MyAsyncModel.integer, 3, MyAsyncModel.list))
+        self.assertEqual(await self.redis.lrange(model.redis_key + '::list', 0, -1), [b'a'])
+
+    async def test_session(self):
+        await MyAsyncModel.create(self.redis, string='a', integer=1)
+        async with AsyncSession(self.redis) as session:
+            a, b = await session.prefetch(MyAsyncModel, ['a', 'b'])
+            self.assertIsNone(b)
+            self.assertIs(await session.get(MyAsyncModel, 'a'), a)
+            a.integer = 2
+            session.add(a)
+            session.add(MyAsyncModel(string='b', integer=3))
+        self.assertEqual(await self.redis.hget(MyAsyncModel.key('a'), 'integer'), b'2')
+        self.assertEqual((await MyAsyncModel.load(self.redis, 'b')).integer, 3)
+
+    async def test_include(self):
+        class AsyncOwner(AsyncModel):
+            id = Field(String, primary_key=True)
+            model = Field(Reference(MyAsyncModel))
+        await MyAsyncModel.create(self.redis, string='a', integer=1)
+        await AsyncOwner.create(self.redis, id='o', model='a')
+        owner = await AsyncOwner.load(self.redis, 'o', include=[AsyncOwner.model])
+        self.assertEqual(owner.model.integer, 1)
+        owners = await AsyncOwner.load_many(self.redis, ['o'], include=True)
+        self.assertEqual(owners[0].model.integer, 1)
+
+    async def test_instrumentation(self):
+        stats = StatsTracer()
+        add_tracer(stats)
+        try:
+            model = await MyAsyncModel.create(self.redis, string='a', integer=1, list=['a'])
+            await MyAsyncModel.load(self.redis, 'a')
+            await model.delete(self.redis)
+        finally:
+            remove_tracer(stats)
+        for operation in ('save', 'load_fields', 'delete'):
+            event = stats.stats[(operation, 'MyAsyncModel')]
+            self.assertEqual(event['count'], 1)
+            self.assertGreater(event['commands'], 0)
+            self.assertIn('round_trip', event['timings'])
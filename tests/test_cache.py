@@ -0,0 +1,119 @@
+import time
+import unittest
+from redis_mock import Redis
+from redistil import *
+
+cache = ObjectCache(maxsize=2)
+
+class CachedModel(Model):
+    id = Field(String, primary_key=True)
+    value = Field(Integer)
+    list = List(String)
+
+    class Meta:
+        cache = cache
+
+class CachedPost(Model):
+    id = Field(String, primary_key=True)
+    author = Field(Reference(CachedModel))
+    editors = List(Reference(CachedModel))
+
+    class Meta:
+        cache = cache
+
+class TestObjectCache(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+        cache.clear()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_read_through(self):
+        CachedModel.create(self.redis, id='abc', value=1, list=['a'])
+        model = CachedModel.load(self.redis, 'abc')
+        self.assertEqual(len(cache), 1)
+
+        # served from the cache
+        self.redis.hset(CachedModel.key('abc'), 'value', '2')
+        model = CachedModel.load(self.redis, 'abc')
+        self.assertEqual(model.value, 1)
+        self.assertEqual(model.dirty_fields, set())
+
+        # modifications don't leak into the cache
+        model.list.append('b')
+        self.assertEqual(CachedModel.load(self.redis, 'abc').list, ['a'])
+
+        # a different field set is a different entry
+        model = CachedModel.load(self.redis, 'abc', CachedModel.value)
+        self.assertEqual(model.value, 2)
+
+    def test_sliding_ttl(self):
+        class SlidingModel(Model):
+            class Meta:
+                cache = cache
+                ttl = 100
+                sliding_ttl = True
+            id = Field(String, primary_key=True)
+            list = List(String)
+        model = SlidingModel.create(self.redis, id='abc', list=['a'])
+        SlidingModel.load(self.redis, 'abc')
+        self.assertEqual(len(cache), 1)
+
+        # cache hits still reset the ttl
+        self.redis.expire(model.redis_key, 10)
+        self.redis.expire(model.redis_key + '::list', 10)
+        hits = cache.hits
+        SlidingModel.load(self.redis, 'abc')
+        self.assertEqual(cache.hits, hits + 1)
+        self.assertTrue(90 < self.redis.ttl(model.redis_key) <= 100)
+        self.assertTrue(90 < self.redis.ttl(model.redis_key + '::list') <= 100)
+
+    def test_references(self):
+        CachedModel.create(self.redis, id='a', value=1)
+        CachedPost.create(self.redis, id='p', author='a', editors=['a'])
+        post = CachedPost.load(self.redis, 'p', include=True)
+        self.assertEqual(post.author.value, 1)
+
+        # unsaved changes to referenced objects don't leak into later cache hits
+        post.author.value = 2
+        post.editors[0].value = 3
+        cached = CachedPost.load(self.redis, 'p')
+        self.assertIsNot(cached.author, post.author)
+        self.assertIsNone(cached.author.value)
+        self.assertIsNone(cached.editors[0].value)
+        self.assertEqual(cached.author.dirty_fields, set())
+        self.assertEqual(CachedPost.load(self.redis, 'p', include=True).author.value, 1)
+
+    def test_invalidation(self):
+        model = CachedModel.create(self.redis, id='abc', value=1)
+        CachedModel.load(self.redis, 'abc')
+        CachedModel.load(self.redis, 'abc', CachedModel.value)
+        self.assertEqual(len(cache), 2)
+
+        model.value = 2
+        model.save(self.redis)
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(CachedModel.load(self.redis, 'abc').value, 2)
+
+        model.delete(self.redis)
+        self.assertIsNone(CachedModel.load(self.redis, 'abc').value)
+
+    def test_eviction(self):
+        for id in ['a', 'b', 'c']:
+            CachedModel.create(self.redis, id=id, value=1)
+            CachedModel.load(self.redis, id)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(CachedModel.key('a'), CachedModel._schema.keys()))
+
+        ttl_cache = ObjectCache(ttl=0.01)
+        ttl_cache.set('key', {'value'}, {'value': 1}, ttl_cache.token())
+        self.assertEqual(ttl_cache.get('key', {'value'}), {'value': 1})
+        time.sleep(0.02)
+        self.assertIsNone(ttl_cache.get('key', {'value'}))
+
+        bytes_cache = ObjectCache(max_bytes=1024)
+        for i in range(100):
+            bytes_cache.set(f'key{i}', {'value'}, {'value': 'x' * 100}, bytes_cache.token())
+        self.assertLessEqual(bytes_cache.bytes, 1024)
+        self.assertLess(len(bytes_cache), 100)
@@ -0,0 +1,149 @@
+import unittest
+from datetime import date, datetime, timezone, timedelta
+from ipaddress import IPv4Address, IPv6Address
+from redis_mock import Redis
+from redistil import *
+
+class PackedModel(Model):
+    class Meta:
+        codec = PackedCodec()
+
+    id = Field(String, primary_key=True)
+    boolean = Field(Boolean)
+    integer = Field(Integer, index=True)
+    float = Field(Float)
+    date = Field(Date)
+    datetime = Field(DateTime)
+    aware = Field(DateTime)
+    ipv4address = Field(IPV4Address)
+    ipv6address = Field(IPV6Address)
+    text = Field(Integer, codec=TextCodec())
+    list = List(Integer)
+
+class BlobModel(Model):
+    class Meta:
+        blob = MsgpackBlob()
+
+    id = Field(String, primary_key=True)
+    name = Field(String, index=True)
+    integer = Field(Integer, codec=PackedCodec())
+    set = Set(Integer)
+
+class CompressedModel(Model):
+    id = Field(String, primary_key=True)
+    text = Field(String, compress='zlib', threshold=100)
+    binary = Field(Binary, compress='lzma', threshold=100)
+    list = List(String, compress='zlib', threshold=100)
+
+class TestCodecs(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_packed(self):
+        values = dict(
+            boolean=True,
+            integer=-5,
+            float=1.5,
+            date=date(2020, 2, 29),
+            datetime=datetime(2020, 1, 1, 12, 30, 15, 123456),
+            aware=datetime(2020, 1, 1, 12, tzinfo=timezone(timedelta(hours=10))),
+            ipv4address=IPv4Address('127.0.0.1'),
+            ipv6address=IPv6Address('::1'),
+            text=3,
+            list=[1, 2],
+        )
+        model = PackedModel.create(self.redis, id='a', **values)
+        stored = self.redis.hgetall(model.redis_key)
+        self.assertEqual(stored[b'integer'], b'\xff' * 7 + b'\xfb')
+        self.assertEqual(len(stored[b'datetime']), 8)
+        self.assertEqual(len(stored[b'ipv6address']), 16)
+        self.assertEqual(stored[b'text'], b'3')
+        self.assertEqual(self.redis.lrange(model.redis_key + '::list', 0, -1), [b'\x00' * 7 + b'\x01', b'\x00' * 7 + b'\x02'])
+
+        model = PackedModel.load(self.redis, 'a')
+        for name, value in values.items():
+            self.assertEqual(getattr(model, name), value)
+        self.assertEqual(model.aware.utcoffset(), timedelta(hours=10))
+
+        # keys and indexes are still text
+        self.assertEqual(PackedModel.find_ids(self.redis, integer=-5), ['a'])
+        self.assertEqual(list(PackedModel.iter_ids(self.redis)), ['a'])
+        with self.assertRaises(TypeError):
+            model.incr(self.redis, PackedModel.integer)
+        self.assertEqual(model.incr(self.redis, PackedModel.text), 4)
+
+    def test_blob(self):
+        model = BlobModel.create(self.redis, id='a', name='a', integer=1, set={1, 2})
+        self.assertEqual(self.redis.type(model.redis_key), b'string')
+
+        model = BlobModel.load(self.redis, 'a', BlobModel.integer)
+        self.assertEqual((model.name, model.integer), (None, 1))
+        model = BlobModel.load(self.redis, 'a')
+        self.assertEqual((model.name, model.integer, model.set), ('a', 1, {1, 2}))
+
+        # the whole blob is rewritten, so saving one field keeps the others
+        model.name = 'b'
+        model.save(self.redis)
+        model = BlobModel.load(self.redis, 'a')
+        self.assertEqual((model.name, model.integer), ('b', 1))
+        self.assertEqual(BlobModel.find_ids(self.redis, name='b'), ['a'])
+        self.assertEqual(BlobModel.find_ids(self.redis, name='a'), [])
+        self.assertEqual([m.id if m else None for m in BlobModel.load_many(self.redis, ['a', 'missing'])], ['a', None])
+
+        # fields which weren't loaded or assigned can't be written, as they would be lost
+        partial = BlobModel.load(self.redis, 'a', BlobModel.integer)
+        partial.integer = 2
+        with self.assertRaises(ValueError):
+            partial.save(self.redis)
+        with self.assertRaises(ValueError):
+            BlobModel(id='a', integer=3).save(self.redis, BlobModel.integer)
+        self.assertEqual(BlobModel.load(self.redis, 'a').name, 'b')
+        # fields loaded or saved as unset are known
+        partial = BlobModel.create(self.redis, id='c', integer=1)
+        partial.integer = 2
+        partial.save(self.redis)
+        partial = BlobModel.load(self.redis, 'c', BlobModel.id, BlobModel.name, BlobModel.integer)
+        partial.integer = 3
+        partial.save(self.redis)
+        self.assertEqual(BlobModel.load(self.redis, 'c').integer, 3)
+        BlobModel(id='c').delete(self.redis)
+
+        with self.assertRaises(TypeError):
+            model.save_if(self.redis, BlobModel.name, 'b')
+        model.delete(self.redis)
+        self.assertEqual(self.redis.keys('*'), [])
+        with self.assertRaises(TypeError):
+            type('Versioned', (Model,), {
+                'Meta': type('Meta', (), {'blob': MsgpackBlob()}),
+                'id': Field(String, primary_key=True),
+                'version': Field(Integer, version=True),
+            })
+
+    def test_compression(self):
+        large = 'abc' * 1000
+        model = CompressedModel.create(self.redis, id='a', text=large, binary=large.encode('utf-8'), list=['small', large])
+        stored = self.redis.hgetall(model.redis_key)
+        self.assertEqual(stored[b'text'][:1], b'\x01')
+        self.assertLess(len(stored[b'text']), 100)
+        self.assertEqual(stored[b'binary'][:1], b'\x02')
+        self.assertEqual(self.redis.lindex(model.redis_key + '::list', 0), b'\x00small')
+
+        loaded = CompressedModel.load_many(self.redis, ['a', 'missing'], decode_workers=2)
+        self.assertEqual(loaded[0].text, large)
+        self.assertEqual(loaded[0].binary, large.encode('utf-8'))
+        self.assertEqual(loaded[0].list, ['small', large])
+        self.assertIsNone(loaded[1])
+
+        model.text = 'short'
+        model.save(self.redis)
+        self.assertEqual(CompressedModel.load(self.redis, 'a').text, 'short')
+
+        stats = CompressedModel.compression_stats()
+        self.assertEqual(set(stats), {'text', 'binary', 'list'})
+        self.assertEqual((stats['text']['values'], stats['text']['compressed']), (2, 1))
+        self.assertLess(stats['text']['ratio'], 0.1)
+        with self.assertRaises(ValueError):
+            Field(String, compress='gzip')
@@ -0,0 +1,61 @@
+import unittest
+import numpy
+from datetime import date, datetime
+from redis_mock import Redis
+from redistil import *
+
+class Row(Model):
+    id = Field(String, primary_key=True)
+    integer = Field(Integer)
+    float = Field(Float)
+    boolean = Field(Boolean)
+    date = Field(Date)
+    datetime = Field(DateTime)
+    string = Field(String)
+    list = List(Integer)
+
+class PackedRow(Model):
+    class Meta:
+        codec = PackedCodec()
+
+    id = Field(String, primary_key=True)
+    integer = Field(Integer)
+    float = Field(Float)
+    boolean = Field(Boolean)
+    date = Field(Date)
+    datetime = Field(DateTime)
+
+class TestColumns(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_load_columns(self):
+        for model in (Row, PackedRow):
+            model.save_many(self.redis, [
+                model(id=str(i), integer=i, float=i / 2, boolean=i % 2 == 0, date=date(2020, 1, i + 1), datetime=datetime(2020, 1, 1, i))
+                for i in range(3)
+            ])
+            columns = model.load_columns(self.redis, ['2', '0', '1'], model.integer, model.float, model.boolean, model.date, model.datetime, chunk_size=2)
+            self.assertEqual(columns['integer'].dtype, numpy.int64)
+            self.assertEqual(columns['integer'].tolist(), [2, 0, 1])
+            self.assertEqual(columns['float'].tolist(), [1.0, 0.0, 0.5])
+            self.assertEqual(columns['boolean'].tolist(), [True, True, False])
+            self.assertEqual(columns['date'].tolist(), [date(2020, 1, 3), date(2020, 1, 1), date(2020, 1, 2)])
+            self.assertEqual(columns['datetime'][0], numpy.datetime64('2020-01-01T02:00'))
+
+            # missing values are masked
+            columns = model.load_columns(self.redis, ['0', 'missing'], model.integer)
+            self.assertEqual(columns['integer'].mask.tolist(), [False, True])
+            self.assertEqual(columns['integer'][0], 0)
+
+    def test_object_columns(self):
+        Row.create(self.redis, id='a', string='abc')
+        columns = Row.load_columns(self.redis, ['a', 'b'], Row.string)
+        self.assertEqual(columns['string'].dtype, object)
+        self.assertEqual(columns['string'].tolist(), ['abc', None])
+        self.assertEqual(set(Row.load_columns(self.redis, ['a'])), {'id', 'integer', 'float', 'boolean', 'date', 'datetime', 'string'})
+        with self.assertRaises(TypeError):
+            Row.load_columns(self.redis, ['a'], Row.list)
@@ -0,0 +1,92 @@
+import os
+import io
+import unittest
+import tempfile
+from datetime import date
+from redis_mock import Redis
+from redistil import *
+
+class Record(Model):
+    id = Field(String, primary_key=True)
+    version = Field(Integer, version=True)
+    age = Field(Integer, index=True)
+    born = Field(Date)
+    data = Field(Binary)
+    notes = Field(String, compress='zlib', threshold=10)
+    tags = List(String)
+    scores = Set(Integer)
+
+class TestDump(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+        self.dir = tempfile.TemporaryDirectory()
+        for i in range(25):
+            Record.create(self.redis, id=str(i), age=i, born=date(2000, 1, 1), data=b'\xff\x00',
+                notes='note ' * 10, tags=['a', 'b'] if i % 2 else [], scores={i, i + 1})
+        Record.load(self.redis, '0').save(self.redis, Record.age)
+
+    def tearDown(self):
+        self.redis.flushall()
+        self.dir.cleanup()
+
+    def dump(self, format):
+        path = os.path.join(self.dir.name, format)
+        with open(path, 'wb') as f:
+            self.assertEqual(dump(self.redis, Record, f, format, batch=10), 25)
+        return path
+
+    def assert_restored(self):
+        records = Record.load_many(self.redis, [str(i) for i in range(25)])
+        self.assertEqual([record.age for record in records], list(range(25)))
+        record = records[1]
+        self.assertEqual((record.born, record.data, record.notes), (date(2000, 1, 1), b'\xff\x00', 'note ' * 10))
+        self.assertEqual((record.tags, record.scores), (['a', 'b'], {1, 2}))
+        self.assertFalse(records[0].tags)
+        self.assertEqual(records[0].version, 2)
+        self.assertEqual(Record.find_ids(self.redis, age=3), ['3'])
+
+    def test_round_trip(self):
+        for format in ('ndjson', 'binary'):
+            path = self.dump(format)
+            self.redis.flushall()
+            self.assertEqual(restore(self.redis, Record, path, chunk_size=7), 25)
+            self.assert_restored()
+            self.redis.flushall()
+            self.assertEqual(restore(self.redis, Record, path, validate=False), 25)
+            self.assert_restored()
+
+    def test_checkpoint(self):
+        for format in ('ndjson', 'binary'):
+            path = self.dump(format)
+            checkpoint = os.path.join(self.dir.name, 'checkpoint')
+            self.redis.flushall()
+
+            # fail after the first chunk
+            execute = PromisePipeline.execute
+            calls = []
+            def failing(p):
+                calls.append(p)
+                if len(calls) > 1:
+                    raise ConnectionError()
+                return execute(p)
+            PromisePipeline.execute = failing
+            try:
+                with self.assertRaises(ConnectionError):
+                    restore(self.redis, Record, path, chunk_size=10, checkpoint=checkpoint)
+            finally:
+                PromisePipeline.execute = execute
+            self.assertEqual(len(list(Record.iter_ids(self.redis))), 10)
+            # chunks aren't wrapped in MULTI/EXEC
+            self.assertFalse(any(p.transaction for p in calls))
+
+            self.assertEqual(restore(self.redis, Record, path, chunk_size=10, checkpoint=checkpoint), 15)
+            self.assertFalse(os.path.exists(checkpoint))
+            self.assert_restored()
+
+    def test_empty(self):
+        self.redis.flushall()
+        f = io.BytesIO()
+        self.assertEqual(dump(self.redis, Record, f), 0)
+        path = os.path.join(self.dir.name, 'empty')
+        open(path, 'wb').close()
+        self.assertEqual(restore(self.redis, Record, path), 0)
@@ -34,3 +34,72 @@ class TestModel(unittest.TestCase):
 
         model = BooleanModel.load(self.redis, 'abc')
         self.assertFalse(model.boolean)
+
+    def test_container_chunked_swap(self):
+        class ContainerModel(Model):
+            id = Field(String, primary_key=True)
+            list = List(Integer, chunk_size=3)
+            set = Set(String, swap=True, chunk_size=2)
+
+        values = list(range(10))
+        model = ContainerModel.create(self.redis, id='abc', list=values, set={'a', 'b', 'c'})
+        self.assertEqual(self.redis.lrange(model.redis_key + '::list', 0, -1), [str(x).encode() for x in values])
+        self.assertEqual(self.redis.smembers(model.redis_key + '::set'), {b'a', b'b', b'c'})
+
+        model.set = {'d'}
+        model.save(self.redis)
+        self.assertEqual(self.redis.smembers(model.redis_key + '::set'), {b'd'})
+        # the temporary key is renamed over the set
+        self.assertEqual(set(self.redis.keys('ContainerModel::abc::set*')), {b'ContainerModel::abc::set'})
+
+        model.set = set()
+        model.save(self.redis)
+        self.assertFalse(self.redis.exists(model.redis_key + '::set'))
+
+    def test_lazy_containers(self):
+        class LazyModel(Model):
+            id = Field(String, primary_key=True)
+            value = Field(Integer)
+            list = List(Integer, lazy=True, chunk_size=3)
+            set = Set(String, lazy=True, chunk_size=2)
+
+        LazyModel.create(self.redis, id='abc', value=1, list=list(range(10)), set={'a', 'b', 'c'})
+
+        model = LazyModel.load(self.redis, 'abc')
+        self.assertIsInstance(model.list, LazyList)
+        self.assertIsInstance(model.set, LazySet)
+        self.assertEqual(len(model.list), 10)
+        self.assertEqual(model.list[0], 0)
+        self.assertEqual(model.list[-1], 9)
+        self.assertEqual(model.list[2:5], [2, 3, 4])
+        self.assertEqual(model.list[:-7], [0, 1, 2])
+        self.assertEqual(model.list[::3], [0, 3, 6, 9])
+        self.assertEqual(list(model.list), list(range(10)))
+        with self.assertRaises(IndexError):
+            model.list[10]
+        self.assertEqual(len(model.set), 3)
+        self.assertTrue('a' in model.set)
+        self.assertFalse('d' in model.set)
+        self.assertEqual(set(model.set), {'a', 'b', 'c'})
+
+        # modifications are written immediately
+        model.list.append(10)
+        model.list.remove(0)
+        model.set.add('d')
+        model.set.remove('a')
+        with self.assertRaises(KeyError):
+            model.set.remove('a')
+        self.assertEqual(self.redis.lrange(model.redis_key + '::list', 0, 0), [b'1'])
+        self.assertEqual(self.redis.llen(model.redis_key + '::list'), 10)
+        self.assertEqual(self.redis.smembers(model.redis_key + '::set'), {b'b', b'c', b'd'})
+
+        # saving doesn't replace lazy containers
+        model.value = 2
+        model.save(self.redis)
+        model.save(self.redis, LazyModel.value, LazyModel.list)
+        self.assertEqual(self.redis.llen(model.redis_key + '::list'), 10)
+
+        # assigning a value replaces the container
+        model.list = [1]
+        model.save(self.redis)
+        self.assertEqual(self.redis.lrange(model.redis_key + '::list', 0, -1), [b'1'])
@@ -0,0 +1,70 @@
+import unittest
+from redis_mock import Redis
+from redistil import *
+
+class TracedModel(Model):
+    id = Field(String, primary_key=True)
+    value = Field(Integer)
+    list = List(String)
+
+class RecordingTracer(Tracer):
+    def __init__(self):
+        self.before_events = []
+        self.events = []
+
+    def before(self, event):
+        self.before_events.append(event)
+
+    def after(self, event):
+        self.events.append(event)
+
+class TestInstrumentation(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+        self.tracer = RecordingTracer()
+        add_tracer(self.tracer)
+
+    def tearDown(self):
+        remove_tracer(self.tracer)
+        self.redis.flushall()
+
+    def test_events(self):
+        model = TracedModel.create(self.redis, id='abc', value=1, list=['a', 'b'])
+        operations = [event.operation for event in self.tracer.events]
+        self.assertEqual(operations, ['validate', 'execute', 'save'])
+        self.assertEqual(len(self.tracer.before_events), 3)
+
+        save = self.tracer.events[-1]
+        self.assertIs(save.model, TracedModel)
+        self.assertEqual(save.fields, {'id', 'value', 'list'})
+        # hset, delete, rpush
+        self.assertEqual(save.commands, 3)
+        self.assertGreater(save.request_bytes, 0)
+        self.assertEqual(set(save.timings), {'validate', 'encode', 'round_trip', 'total'})
+
+        self.tracer.events.clear()
+        TracedModel.load(self.redis, 'abc', TracedModel.value)
+        load = self.tracer.events[-1]
+        self.assertEqual(load.operation, 'load_fields')
+        # hmget, exists
+        self.assertEqual(load.commands, 2)
+        self.assertGreater(load.reply_bytes, 0)
+        self.assertEqual(set(load.timings), {'encode', 'round_trip', 'decode', 'total'})
+
+        self.tracer.events.clear()
+        model.delete(self.redis)
+        self.assertEqual(self.tracer.events[-1].operation, 'delete')
+        self.assertEqual(self.tracer.events[-1].commands, 2)
+
+    def test_stats_tracer(self):
+        stats = StatsTracer()
+        add_tracer(stats)
+        try:
+            for i in range(3):
+                TracedModel.create(self.redis, id=str(i), value=i)
+        finally:
+            remove_tracer(stats)
+        save = stats.stats[('save', 'TracedModel')]
+        self.assertEqual(save['count'], 3)
+        self.assertEqual(save['commands'], 3)
+        self.assertIn('round_trip', save['timings'])
@@ -1,7 +1,8 @@
 import unittest
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 from ipaddress import IPv4Address, IPv6Address
 from redis_mock import Redis
+from redis.crc import key_slot
 from redistil import *
 
 class MyModel(Model):
@@ -189,6 +190,140 @@ class TestModel(unittest.TestCase):
         )
         model.delete(self.redis)
 
+    def test_load_save_delete_many(self):
+        models = [MyModel(string=f'string{i}', ipv6address=IPv6Address('::1'), integer=i, list=['a', str(i)]) for i in range(5)]
+        MyModel.save_many(self.redis, models, chunk_size=2)
+        for model in models:
+            self.assertTrue(self.redis.exists(model.redis_key))
+            self.assertTrue(self.redis.exists(model.redis_key + '::list'))
+
+        ids = ['string3', 'missing', 'string0']
+        loaded = MyModel.load_many(self.redis, ids, MyModel.integer, MyModel.list, chunk_size=2)
+        self.assertEqual(len(loaded), 3)
+        self.assertIsNone(loaded[1])
+        self.assertEqual(loaded[0].string, 'string3')
+        self.assertEqual(loaded[0].integer, 3)
+        self.assertEqual(loaded[0].list, ['a', '3'])
+        self.assertIsNone(loaded[0].ipv6address)
+        self.assertEqual(loaded[2].integer, 0)
+
+        # the reply to HGETALL is empty for missing objects, so EXISTS isn't sent
+        counts = []
+        execute = PromisePipeline.execute
+        def counted(p):
+            counts.append(p.commands)
+            return execute(p)
+        PromisePipeline.execute = counted
+        try:
+            loaded = MyModel.load_many(self.redis, ids)
+        finally:
+            PromisePipeline.execute = execute
+        self.assertEqual(counts, [9])
+        self.assertIsNone(loaded[1])
+        self.assertEqual(loaded[0].list, ['a', '3'])
+
+        MyModel.delete_many(self.redis, models, chunk_size=2)
+        for model in models:
+            self.assertFalse(self.redis.exists(model.redis_key))
+            self.assertFalse(self.redis.exists(model.redis_key + '::list'))
+
+    def test_load_ignores_unknown_hash_fields(self):
+        model = MyModel.create(self.redis, string='string', ipv6address=IPv6Address('::1'), integer=1)
+        self.redis.hset(model.redis_key, 'removed_field', 'value')
+
+        model = MyModel.load(self.redis, 'string')
+        self.assertEqual(model.integer, 1)
+        self.assertEqual(model.ipv6address, IPv6Address('::1'))
+        self.assertFalse(hasattr(model, 'removed_field'))
+
+    def test_load_missing(self):
+        # containers are empty rather than missing, so existence is decided by the hash
+        for fields in ((), (MyModel.integer, MyModel.list), (MyModel.list,)):
+            model = MyModel.load(self.redis, 'missing', *fields)
+            self.assertFalse(model._persisted)
+            model.integer = 1
+            # the whole object is written, so the required field is checked
+            with self.assertRaises(ValueError):
+                model.save(self.redis)
+        self.assertFalse(self.redis.exists(MyModel.key('missing')))
+
+    def test_save_dirty_fields(self):
+        model = MyModel.create(self.redis, string='string', ipv6address=IPv6Address('::1'),
+            integer=1, float=1.5, set={1, 2, 3}, list=['a', 'b'])
+        self.assertEqual(model.dirty_fields, set())
+
+        model = MyModel.load(self.redis, 'string')
+        self.assertEqual(model.dirty_fields, set())
+        # modify values behind the model's back, these should not be overwritten
+        self.redis.hset(model.redis_key, 'float', '2.5')
+        self.redis.rpush(model.redis_key + '::list', 'external')
+
+        model.integer = 2
+        self.assertEqual(model.dirty_fields, {'integer'})
+        model.save(self.redis)
+        self.assertEqual(model.dirty_fields, set())
+        self.assertEqual(self.redis.hget(model.redis_key, 'integer'), b'2')
+        self.assertEqual(self.redis.hget(model.redis_key, 'float'), b'2.5')
+
+        # in-place modifications are detected and saved as deltas
+        model.set.remove(1)
+        model.set.add(4)
+        model.list.append('c')
+        self.assertEqual(model.dirty_fields, {'set', 'list'})
+        model.save(self.redis)
+        self.assertEqual(self.redis.smembers(model.redis_key + '::set'), {b'2', b'3', b'4'})
+        self.assertEqual(self.redis.lrange(model.redis_key + '::list', 0, -1), [b'a', b'b', b'external', b'c'])
+
+        # non-append list modifications replace the list
+        model.list = ['z']
+        model.save(self.redis)
+        self.assertEqual(self.redis.lrange(model.redis_key + '::list', 0, -1), [b'z'])
+
+    def test_validator_cache(self):
+        class CachedModel(Model):
+            id = Field(String, primary_key=True)
+            integer = Field(Integer)
+            email = Field(EmailAddress)
+
+        stats = CachedModel.validator_stats()
+        model = CachedModel.create(self.redis, id='abc', integer=1, email='test@example.com')
+        model.email = 'other@example.com'
+        model.save(self.redis)
+        model.email = 'another@example.com'
+        model.save(self.redis)
+        stats = CachedModel.validator_stats()
+        # full save, then two saves of 'email' alone
+        self.assertEqual(stats['misses'], 2)
+        self.assertEqual(stats['hits'], 1)
+
+        # plain fields skip cerberus
+        model.integer = 2
+        model.save(self.redis)
+        self.assertEqual(CachedModel.validator_stats()['fast'], 1)
+
+        model.integer = 'abc'
+        with self.assertRaises(ValueError):
+            model.save(self.redis)
+        with self.assertRaises(ValueError):
+            CachedModel(integer=1).save(self.redis, CachedModel.id, CachedModel.integer)
+
+    def test_iter_all(self):
+        for i in range(25):
+            MyModel.create(self.redis, string=f'string{i}', ipv6address=IPv6Address('::1'), integer=i, set={i}, list=['a'])
+        # keys from other models with a similar prefix are ignored
+        self.redis.hset('MyModelOther::abc', 'string', 'abc')
+
+        ids = sorted(MyModel.iter_all(self.redis, batch=10, ids_only=True))
+        self.assertEqual(ids, sorted(f'string{i}' for i in range(25)))
+
+        models = list(MyModel.iter_all(self.redis, MyModel.integer, batch=10))
+        self.assertEqual(sorted(m.integer for m in models), list(range(25)))
+        self.assertIsNone(models[0].set)
+
+        models = list(MyModel.iter_all(self.redis, batch=4, workers=3))
+        self.assertEqual(sorted(m.integer for m in models), list(range(25)))
+        self.assertTrue(all(m.set == {m.integer} for m in models))
+
     def test_simple_model(self):
         class TestModel(Model):
             string = Field(String, primary_key=True)
@@ -198,3 +333,368 @@ class TestModel(unittest.TestCase):
 
         model = TestModel(string='string')
         model.save(self.redis)
+
+    def test_star_import(self):
+        namespace = {}
+        exec('from redistil import *', namespace)
+        self.assertIn('Model', namespace)
+        # helpers imported by the module aren't exported
+        for name in ['random', 'sleep', 'copy', 'models', 'chunks', 'decode']:
+            self.assertNotIn(name, namespace)
+
+class IndexedModel(Model):
+    id = Field(String, primary_key=True)
+    email = Field(String, index=True)
+    age = Field(Integer, index=True)
+    created = Field(Date, index=True)
+
+class TestIndex(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_find_by(self):
+        IndexedModel.create(self.redis, id='a', email='a@example.com', age=20)
+        IndexedModel.create(self.redis, id='b', email='b@example.com', age=30)
+        IndexedModel.create(self.redis, id='c', email='a@example.com', age=30)
+
+        self.assertEqual(IndexedModel.find_ids(self.redis, email='a@example.com'), ['a', 'c'])
+        self.assertEqual(IndexedModel.find_ids(self.redis, email='a@example.com', age=30), ['c'])
+        self.assertEqual([m.id for m in IndexedModel.find_by(self.redis, age=30)], ['b', 'c'])
+        self.assertEqual(IndexedModel.find_by(self.redis, email='x@example.com'), [])
+        with self.assertRaises(ValueError):
+            IndexedModel.find_ids(self.redis, id='a')
+
+        # changing a value moves it to the new index entry
+        model = IndexedModel.load(self.redis, 'a')
+        model.email = 'x@example.com'
+        model.save(self.redis)
+        self.assertEqual(IndexedModel.find_ids(self.redis, email='a@example.com'), ['c'])
+        self.assertEqual(IndexedModel.find_ids(self.redis, email='x@example.com'), ['a'])
+
+        # the old value is read from redis when it isn't known
+        IndexedModel(id='c', email='y@example.com').save(self.redis, IndexedModel.email)
+        self.assertEqual(IndexedModel.find_ids(self.redis, email='a@example.com'), [])
+
+        IndexedModel.load(self.redis, 'b', IndexedModel.email).delete(self.redis)
+        self.assertEqual(IndexedModel.find_ids(self.redis, age=30), ['c'])
+        self.assertEqual(IndexedModel.find_ids(self.redis, email='b@example.com'), [])
+
+    def test_concurrent_save(self):
+        IndexedModel.create(self.redis, id='a', email='a@example.com')
+        model = IndexedModel.load(self.redis, 'a')
+
+        # another client moves the object after its stored value has been read
+        execute = PromisePipeline.execute
+        saves = []
+        def concurrent(p):
+            values = execute(p)
+            if not saves:
+                saves.append(p)
+                IndexedModel(id='a', email='b@example.com').save(self.redis, IndexedModel.email)
+            return values
+        PromisePipeline.execute = concurrent
+        try:
+            model.email = 'c@example.com'
+            model.save(self.redis)
+        finally:
+            PromisePipeline.execute = execute
+
+        # the save is retried with the value the other client wrote
+        self.assertEqual(IndexedModel.find_ids(self.redis, email='b@example.com'), [])
+        self.assertEqual(IndexedModel.find_ids(self.redis, email='c@example.com'), ['a'])
+        self.assertEqual(IndexedModel.load(self.redis, 'a').email, 'c@example.com')
+
+    def test_range(self):
+        for i, id in enumerate('abcde'):
+            IndexedModel.create(self.redis, id=id, age=i * 10, created=date(2020, 1, i + 1))
+
+        models = IndexedModel.range(self.redis, IndexedModel.age, 10, 30)
+        self.assertEqual([m.id for m in models], ['b', 'c', 'd'])
+        self.assertEqual(IndexedModel.range_ids(self.redis, IndexedModel.age, 10, limit=2, offset=1), ['c', 'd'])
+        self.assertEqual(IndexedModel.range_ids(self.redis, IndexedModel.created, hi=date(2020, 1, 2)), ['a', 'b'])
+        with self.assertRaises(ValueError):
+            IndexedModel.range_ids(self.redis, IndexedModel.email)
+
+
+class VersionedModel(Model):
+    id = Field(String, primary_key=True)
+    name = Field(String)
+    version = Field(Integer, version=True)
+
+class TestVersion(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_version(self):
+        model = VersionedModel.create(self.redis, id='a', name='a')
+        self.assertEqual(model.version, 1)
+        model.name = 'b'
+        model.save(self.redis)
+        self.assertEqual(model.version, 2)
+        self.assertEqual(self.redis.hget(model.redis_key, 'version'), b'2')
+        VersionedModel.save_many(self.redis, [model], VersionedModel.name)
+        self.assertEqual(model.version, 3)
+        self.assertEqual(model.dirty_fields, set())
+        with self.assertRaises(TypeError):
+            Field(String, version=True)
+
+    def test_check_version(self):
+        VersionedModel.create(self.redis, id='a', name='a')
+        first = VersionedModel.load(self.redis, 'a')
+        second = VersionedModel.load(self.redis, 'a')
+        first.name = 'first'
+        first.save(self.redis, check_version=True)
+        self.assertEqual(first.version, 2)
+
+        second.name = 'second'
+        with self.assertRaises(ConflictError):
+            second.save(self.redis, check_version=True)
+        self.assertEqual(second.dirty_fields, {'name'})
+        self.assertEqual(VersionedModel.load(self.redis, 'a').name, 'first')
+
+        # loading some fields also loads the version
+        third = VersionedModel.load(self.redis, 'a', VersionedModel.name)
+        self.assertEqual(third.version, 2)
+        third.name = 'third'
+        third.save(self.redis, check_version=True)
+        self.assertEqual(third.version, 3)
+        # the version of objects which weren't loaded is unknown
+        unloaded = VersionedModel.trusted(id='a')
+        unloaded.name = 'unloaded'
+        with self.assertRaises(ValueError):
+            unloaded.save(self.redis, check_version=True)
+
+        # new objects must not already exist
+        with self.assertRaises(ConflictError):
+            VersionedModel(id='a', name='new').save(self.redis, check_version=True)
+        with self.assertRaises(TypeError):
+            MyModel(string='a').save(self.redis, MyModel.string, check_version=True)
+
+    def test_incr(self):
+        class VersionedCounter(Model):
+            id = Field(String, primary_key=True)
+            count = Field(Integer)
+            version = Field(Integer, version=True)
+
+        VersionedCounter.create(self.redis, id='a', count=1)
+        stale = VersionedCounter.load(self.redis, 'a')
+        other = VersionedCounter.load(self.redis, 'a')
+        self.assertEqual(other.incr(self.redis, VersionedCounter.count), 2)
+        self.assertEqual(other.version, 2)
+        self.assertEqual(other.dirty_fields, set())
+
+        # the increment can't be overwritten by a save which started before it
+        stale.count = 100
+        self.assertFalse(stale.save_if(self.redis, VersionedCounter.version, stale.version))
+        with self.assertRaises(ConflictError):
+            stale.save(self.redis, check_version=True)
+        self.assertEqual(VersionedCounter.load(self.redis, 'a').count, 2)
+
+    def test_update(self):
+        VersionedModel.create(self.redis, id='a', name='a')
+        calls = []
+        def rename(model):
+            # another client saves the object during the first attempt
+            if not calls:
+                VersionedModel.update(self.redis, 'a', lambda m: setattr(m, 'name', 'other'))
+            calls.append(model.version)
+            model.name += '!'
+
+        model = VersionedModel.update(self.redis, 'a', rename, backoff=0)
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual((model.name, model.version), ('other!', 3))
+
+        def conflict(model):
+            self.redis.hincrby(model.redis_key, 'version', 1)
+            model.name = 'lost'
+        with self.assertRaises(ConflictError):
+            VersionedModel.update(self.redis, 'a', conflict, retries=2, backoff=0)
+        self.assertNotEqual(VersionedModel.load(self.redis, 'a').name, 'lost')
+
+
+class SlottedModel(Model):
+    class Meta:
+        slots = True
+
+    id = Field(String, primary_key=True)
+    integer = Field(Integer)
+    list = List(String)
+
+class TestSlots(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_slots(self):
+        model = SlottedModel.create(self.redis, id='a', integer=1, list=['a'])
+        self.assertFalse(hasattr(model, '__dict__'))
+        with self.assertRaises(AttributeError):
+            model.other = 1
+        model = SlottedModel.load(self.redis, 'a')
+        self.assertEqual((model.integer, model.list), (1, ['a']))
+        self.assertIsNone(model._dirty)
+        # loaded objects share their keys with the model
+        self.assertTrue(all(k is SlottedModel._hash_keys[k] for k in model._data if k in SlottedModel._hash_fields))
+        model.list.append('b')
+        model.save(self.redis)
+        self.assertEqual(SlottedModel.load(self.redis, 'a').list, ['a', 'b'])
+        # models without Meta.slots are unchanged
+        self.assertTrue(hasattr(MyModel(string='a'), '__dict__'))
+
+    def test_trusted(self):
+        model = SlottedModel.trusted(id='a', integer=1)
+        self.assertEqual(model.integer, 1)
+        self.assertEqual(model.dirty_fields, set())
+        # dirty tracking and snapshots aren't allocated until they're needed
+        self.assertIsNone(model._dirty)
+        self.assertIsNone(model._original)
+        model.integer = 2
+        model.save(self.redis)
+        self.assertEqual(self.redis.hgetall(model.redis_key), {b'integer': b'2'})
+
+
+class ExpiringModel(Model):
+    class Meta:
+        ttl = 100
+        sliding_ttl = True
+
+    id = Field(String, primary_key=True)
+    integer = Field(Integer)
+    list = List(String)
+    set = Set(Integer)
+
+class TestTTL(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_ttl(self):
+        model = ExpiringModel.create(self.redis, id='a', integer=1, list=['a'], set={1})
+        for key in (model.redis_key, model.redis_key + '::list', model.redis_key + '::set'):
+            self.assertTrue(90 < self.redis.ttl(key) <= 100)
+
+        # containers that aren't saved are expired too
+        model.integer = 2
+        model.save(self.redis, ttl=timedelta(seconds=1000))
+        self.assertTrue(900 < self.redis.ttl(model.redis_key + '::set') <= 1000)
+        ExpiringModel.save_many(self.redis, [model], ExpiringModel.integer, ttl=500)
+        self.assertTrue(400 < self.redis.ttl(model.redis_key + '::list') <= 500)
+
+    def test_keep_ttl(self):
+        model = MyModel.create(self.redis, string='a', ipv6address=IPv6Address('::1'), list=['a'], set={1})
+        model.integer = 1
+        model.save(self.redis, ttl=60)
+        # replaced containers keep the hash's ttl when saved without one
+        model.list = ['b']
+        model.set = {2}
+        # the script is loaded again if the server doesn't have it
+        self.redis.script_flush()
+        model.save(self.redis)
+        for key in (model.redis_key, model.redis_key + '::list', model.redis_key + '::set'):
+            self.assertTrue(50 < self.redis.ttl(key) <= 60)
+        model.list = ['c']
+        self.assertTrue(model.save_if(self.redis, MyModel.string, 'a'))
+        self.assertTrue(50 < self.redis.ttl(model.redis_key + '::list') <= 60)
+        # objects without a ttl don't gain one
+        model = MyModel.create(self.redis, string='b', ipv6address=IPv6Address('::1'), list=['a'])
+        self.assertEqual(self.redis.ttl(model.redis_key + '::list'), -1)
+
+    def test_sliding_ttl(self):
+        model = ExpiringModel.create(self.redis, id='a', integer=1, list=['a'])
+        self.redis.expire(model.redis_key, 10)
+        self.redis.expire(model.redis_key + '::list', 10)
+        model = ExpiringModel.load(self.redis, 'a', ExpiringModel.integer)
+        self.assertEqual(model.integer, 1)
+        self.assertTrue(90 < self.redis.ttl(model.redis_key) <= 100)
+        self.assertTrue(90 < self.redis.ttl(model.redis_key + '::list') <= 100)
+        # missing keys aren't created
+        ExpiringModel.load_many(self.redis, ['missing'])
+        self.assertFalse(self.redis.exists(ExpiringModel.key('missing')))
+
+
+class TaggedModel(Model):
+    class Meta:
+        hash_tags = True
+
+    id = Field(String, primary_key=True)
+    age = Field(Integer, index=True)
+    list = List(String)
+
+class TestHashTags(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_keys(self):
+        model = TaggedModel.create(self.redis, id='a', age=1, list=['a'])
+        self.assertEqual(model.redis_key, 'TaggedModel::{a}')
+        self.assertTrue(self.redis.exists('TaggedModel::{a}', 'TaggedModel::{a}::list'))
+        self.assertEqual(list(TaggedModel.iter_ids(self.redis)), ['a'])
+
+        model = TaggedModel.load(self.redis, 'a')
+        self.assertEqual((model.age, list(model.list)), (1, ['a']))
+        model.delete(self.redis)
+        self.assertFalse(self.redis.exists('TaggedModel::{a}', 'TaggedModel::{a}::list'))
+
+    def test_save_many(self):
+        models = [TaggedModel(id=str(i), age=i) for i in range(10)]
+        queued = [(*queued, {}) for queued in TaggedModel._validate_many(models)]
+        nodes, versions = TaggedModel._queue_save_many(self.redis, queued)
+        slots = {key_slot(model.redis_key.encode('utf-8')) for model in models}
+        # a single node, with a transaction per slot followed by the index updates
+        self.assertEqual(len(nodes), 1)
+        self.assertEqual(len(nodes[0]), len(slots) + 1)
+        self.assertTrue(all(p.transaction for p in nodes[0][:-1]))
+        self.assertFalse(nodes[0][-1].transaction)
+
+        # per chunk, a round trip per slot and one to update indexes
+        # sorted set entries are replaced, so the stored values of age aren't read
+        counts = []
+        execute = PromisePipeline.execute
+        def counted(p):
+            counts.append(p.commands)
+            return execute(p)
+        PromisePipeline.execute = counted
+        try:
+            TaggedModel.save_many(self.redis, [TaggedModel(id=str(i), age=i) for i in range(20)], chunk_size=10)
+        finally:
+            PromisePipeline.execute = execute
+        slots = [{key_slot(f'TaggedModel::{{{i}}}'.encode('utf-8')) for i in range(start, start + 10)} for start in (0, 10)]
+        self.assertEqual(len(counts), sum(len(chunk) + 1 for chunk in slots))
+        self.assertEqual(TaggedModel.load(self.redis, '19').age, 19)
+
+        # versions are read from the replies to each transaction
+        class TaggedVersion(Model):
+            class Meta:
+                hash_tags = True
+            id = Field(String, primary_key=True)
+            version = Field(Integer, version=True)
+        objs = [TaggedVersion(id=str(i)) for i in range(10)]
+        TaggedVersion.save_many(self.redis, objs)
+        TaggedVersion.save_many(self.redis, objs[:5], TaggedVersion.id)
+        self.assertEqual([obj.version for obj in objs], [2] * 5 + [1] * 5)
+
+        TaggedModel.save_many(self.redis, models, workers=4)
+        self.assertEqual(TaggedModel.range_ids(self.redis, TaggedModel.age, 3, 5), ['3', '4', '5'])
+        models[3].age = 30
+        TaggedModel.save_many(self.redis, models)
+        self.assertEqual(TaggedModel.range_ids(self.redis, TaggedModel.age, 3, 5), ['4', '5'])
+
+    def test_scripts(self):
+        model = TaggedModel.create(self.redis, id='a', age=1)
+        self.assertEqual(model.incr(self.redis, TaggedModel.age, 10), 11)
+        self.assertTrue(model.compare_and_set(self.redis, TaggedModel.age, 11, 20))
+        self.assertEqual(TaggedModel.range_ids(self.redis, TaggedModel.age, 20, 20), ['a'])
+        self.assertEqual(TaggedModel.range_ids(self.redis, TaggedModel.age, 0, 19), [])
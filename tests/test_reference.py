@@ -0,0 +1,73 @@
+import unittest
+from redis_mock import Redis
+from redistil import *
+
+class Company(Model):
+    id = Field(String, primary_key=True)
+    name = Field(String)
+
+class Writer(Model):
+    id = Field(String, primary_key=True)
+    name = Field(String)
+    company = Field(Reference(Company))
+
+class Article(Model):
+    id = Field(String, primary_key=True)
+    title = Field(String)
+    author = Field(Reference(Writer), index=True)
+    editors = List(Reference('Writer'))
+    related = Set(Reference('Article'))
+
+class TestReference(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+        Company.create(self.redis, id='c', name='Company')
+        Writer.create(self.redis, id='a', name='A', company='c')
+        Writer.create(self.redis, id='b', name='B')
+        for i in range(5):
+            Article.create(self.redis, id=str(i), title=f'article {i}', author='a', editors=['a', 'b'], related={'0'})
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_reference(self):
+        self.assertEqual(self.redis.hget(Article.key('0'), 'author'), b'a')
+        self.assertEqual(Article.find_ids(self.redis, author=Writer(id='a')), [str(i) for i in range(5)])
+
+        article = Article.load(self.redis, '0')
+        self.assertIsInstance(article.author, Writer)
+        self.assertEqual((article.author.id, article.author.name), ('a', None))
+        self.assertEqual([author.id for author in article.editors], ['a', 'b'])
+        self.assertEqual(article.dirty_fields, set())
+        with self.assertRaises(TypeError):
+            article.author = Company(id='c')
+
+        article.author = Writer.load(self.redis, 'b')
+        article.save(self.redis)
+        self.assertEqual(Article.find_ids(self.redis, author='b'), ['0'])
+
+    def test_include(self):
+        articles = Article.load_many(self.redis, [str(i) for i in range(5)], include=[Article.author, Article.editors])
+        self.assertEqual({article.author.name for article in articles}, {'A'})
+        self.assertEqual([author.name for author in articles[0].editors], ['A', 'B'])
+        self.assertEqual(next(iter(articles[0].related)).title, None)
+        # not included, or beyond the depth
+        self.assertIsNone(articles[0].author.company.name)
+
+        article = Article.load(self.redis, '0', include=True, depth=2)
+        self.assertEqual(article.author.company.name, 'Company')
+        self.assertEqual(next(iter(article.related)).title, 'article 0')
+
+    def test_round_trips(self):
+        pipelines = []
+        execute = PromisePipeline.execute
+        def counted(p):
+            pipelines.append(p)
+            return execute(p)
+        PromisePipeline.execute = counted
+        try:
+            Article.load_many(self.redis, [str(i) for i in range(5)], include=True, depth=3)
+        finally:
+            PromisePipeline.execute = execute
+        # the articles, then the writers and articles, then the companies and writers, then nothing new
+        self.assertEqual(len(pipelines), 4)
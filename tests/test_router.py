@@ -0,0 +1,113 @@
+import unittest
+from time import sleep
+from fakeredis import FakeRedis, FakeServer, FakeAsyncRedis
+from redistil import *
+
+class Routed(Model):
+    id = Field(String, primary_key=True)
+    value = Field(Integer, index=True)
+    name = Field(String, index=True)
+    list = List(String)
+
+class Sliding(Model):
+    class Meta:
+        ttl = 100
+        sliding_ttl = True
+
+    id = Field(String, primary_key=True)
+    value = Field(Integer)
+    list = List(String)
+
+class AsyncRouted(AsyncModel):
+    id = Field(String, primary_key=True)
+    value = Field(Integer)
+
+class AsyncSliding(AsyncModel):
+    class Meta:
+        ttl = 100
+        sliding_ttl = True
+
+    id = Field(String, primary_key=True)
+    value = Field(Integer)
+
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.primary = FakeRedis(server=FakeServer())
+        self.replicas = [FakeRedis(server=FakeServer()) for _ in range(2)]
+
+    def replicate(self):
+        # replicas have a different value so reads can be told apart
+        for i, replica in enumerate(self.replicas):
+            Routed.create(replica, id='a', value=10 + i, name='replica', list=['replica'])
+
+    def test_routing(self):
+        router = Router(self.primary, self.replicas)
+        Routed.create(router, id='a', value=1, name='primary', list=['primary'])
+        self.assertTrue(self.primary.exists(Routed.key('a')))
+        self.assertFalse(any(replica.exists(Routed.key('a')) for replica in self.replicas))
+
+        self.replicate()
+        # round robin
+        values = [Routed.load(router, 'a').value for _ in range(4)]
+        self.assertIn(values, ([10, 11, 10, 11], [11, 10, 11, 10]))
+        self.assertEqual(Routed.load_many(router, ['a'])[0].list, ['replica'])
+        self.assertEqual(Routed.find_ids(router, name='replica'), ['a'])
+        self.assertEqual(list(Routed.iter_ids(router)), ['a'])
+
+        # the stored index values are read from the primary
+        Routed(id='a', name='new').save(router, Routed.name)
+        self.assertEqual(Routed.find_ids(self.primary, name='primary'), [])
+        self.assertEqual(Routed.find_ids(self.primary, name='new'), ['a'])
+
+        Routed(id='a').delete(router)
+        self.assertFalse(self.primary.exists(Routed.key('a')))
+        self.assertTrue(self.replicas[0].exists(Routed.key('a')))
+
+    def test_read_your_writes(self):
+        router = Router(self.primary, self.replicas, read_your_writes=0.1)
+        self.replicate()
+        Routed.create(router, id='a', value=1)
+        self.assertEqual(Routed.load(router, 'a').value, 1)
+        sleep(0.15)
+        self.assertIn(Routed.load(router, 'a').value, (10, 11))
+
+    def test_sliding_ttl(self):
+        router = Router(self.primary, self.replicas[:1], read_your_writes=60)
+        Sliding.create(self.primary, id='a', value=1, list=['a'])
+        Sliding.create(self.replicas[0], id='a', value=2, list=['b'])
+        self.primary.expire(Sliding.key('a'), 10)
+        # the reads are served by the replica, the ttl is refreshed on the primary
+        model = Sliding.load(router, 'a')
+        self.assertEqual((model.value, model.list), (2, ['b']))
+        self.assertTrue(90 < self.primary.ttl(Sliding.key('a')) <= 100)
+        self.assertTrue(90 < self.primary.ttl(Sliding.key('a') + '::list') <= 100)
+        # refreshes don't pin reads to the primary
+        self.assertEqual(router.pinned_until, 0.0)
+        self.assertEqual(Sliding.load(router, 'a').value, 2)
+
+    def test_latency(self):
+        router = Router(self.primary, self.replicas, strategy='latency')
+        self.replicate()
+        router.latencies = [0.5, 0.1]
+        self.assertEqual(Routed.load(router, 'a').value, 11)
+        self.assertTrue(0 < router.latencies[1] < 0.1)
+        with self.assertRaises(ValueError):
+            Router(self.primary, strategy='random')
+
+class TestAsyncRouter(unittest.IsolatedAsyncioTestCase):
+    async def test_routing(self):
+        primary, replica = FakeAsyncRedis(server=FakeServer()), FakeAsyncRedis(server=FakeServer())
+        router = Router(primary, [replica])
+        await AsyncRouted.create(router, id='a', value=1)
+        await AsyncRouted.create(replica, id='a', value=2)
+        self.assertEqual((await AsyncRouted.load(router, 'a')).value, 2)
+        self.assertEqual((await AsyncRouted.load(primary, 'a')).value, 1)
+
+    async def test_sliding_ttl(self):
+        primary, replica = FakeAsyncRedis(server=FakeServer()), FakeAsyncRedis(server=FakeServer())
+        router = Router(primary, [replica])
+        await AsyncSliding.create(primary, id='a', value=1)
+        await AsyncSliding.create(replica, id='a', value=2)
+        await primary.expire(AsyncSliding.key('a'), 10)
+        self.assertEqual((await AsyncSliding.load(router, 'a')).value, 2)
+        self.assertTrue(90 < await primary.ttl(AsyncSliding.key('a')) <= 100)
@@ -0,0 +1,72 @@
+import unittest
+from redis_mock import Redis
+from redistil import *
+
+class Counter(Model):
+    id = Field(String, primary_key=True)
+    count = Field(Integer, index=True)
+    total = Field(Float)
+    status = Field(String, index=True)
+    version = Field(Integer)
+    tags = Set(String)
+
+class TestScripts(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_script_reload(self):
+        script = Script('return ARGV[1]')
+        self.assertEqual(script(self.redis, [], ['a']), b'a')
+        self.redis.script_flush()
+        self.assertEqual(script(self.redis, [], ['b']), b'b')
+
+    def test_incr(self):
+        obj = Counter(id='a')
+        self.assertEqual(obj.incr(self.redis, Counter.count, 5), 5)
+        self.assertEqual(obj.incr(self.redis, Counter.count), 6)
+        self.assertEqual(obj.incr(self.redis, Counter.total, 1.5), 1.5)
+        self.assertEqual(obj.count, 6)
+        self.assertNotIn('count', obj.dirty_fields)
+        self.assertEqual(Counter.load(self.redis, 'a').count, 6)
+        self.assertEqual(Counter.range_ids(self.redis, Counter.count, 6, 6), ['a'])
+        with self.assertRaises(TypeError):
+            obj.incr(self.redis, Counter.status)
+
+    def test_compare_and_set(self):
+        obj = Counter.create(self.redis, id='a', status='new')
+        self.assertTrue(obj.compare_and_set(self.redis, Counter.status, 'new', 'active'))
+        self.assertEqual(Counter.find_ids(self.redis, status='active'), ['a'])
+        self.assertEqual(Counter.find_ids(self.redis, status='new'), [])
+
+        # a stale expected value leaves the stored and local values unchanged
+        self.assertFalse(obj.compare_and_set(self.redis, Counter.status, 'new', 'closed'))
+        self.assertEqual(obj.status, 'active')
+        self.assertEqual(obj.dirty_fields, set())
+        self.assertEqual(self.redis.hget(obj.redis_key, 'status'), b'active')
+
+        # None expects the field to be unset
+        self.assertFalse(obj.compare_and_set(self.redis, Counter.status, None, 'closed'))
+        self.assertTrue(obj.compare_and_set(self.redis, Counter.version, None, 1))
+        self.assertEqual(self.redis.hget(obj.redis_key, 'version'), b'1')
+
+        with self.assertRaises(ValueError):
+            obj.compare_and_set(self.redis, Counter.version, 1, 'abc')
+        self.assertEqual(obj.version, 1)
+
+    def test_save_if(self):
+        obj = Counter.create(self.redis, id='a', status='new', version=1, tags={'a'})
+        obj.status = 'active'
+        obj.version = 2
+        obj.tags.add('b')
+        self.assertTrue(obj.save_if(self.redis, Counter.version, 1))
+        loaded = Counter.load(self.redis, 'a')
+        self.assertEqual((loaded.status, loaded.version, loaded.tags), ('active', 2, {'a', 'b'}))
+        self.assertEqual(Counter.find_ids(self.redis, status='active'), ['a'])
+
+        obj.status = 'closed'
+        self.assertFalse(obj.save_if(self.redis, Counter.version, 1))
+        self.assertEqual(obj.dirty_fields, {'status'})
+        self.assertEqual(self.redis.hget(obj.redis_key, 'status'), b'active')
@@ -0,0 +1,76 @@
+import unittest
+from redis_mock import Redis
+from redistil import *
+
+class User(Model):
+    id = Field(String, primary_key=True)
+    name = Field(String)
+    visits = Field(Integer, index=True)
+    tags = List(String)
+
+class Post(Model):
+    id = Field(String, primary_key=True)
+    user = Field(String)
+    title = Field(String)
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+        User.create(self.redis, id='a', name='A', visits=1, tags=['x'])
+        User.create(self.redis, id='b', name='B', visits=2)
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_identity_map(self):
+        with Session(self.redis) as session:
+            a, b, c = session.prefetch(User, ['a', 'b', 'c'])
+            self.assertEqual((a.name, b.visits, c), ('A', 2, None))
+            self.assertIs(session.get(User, 'a'), a)
+            self.assertIsNone(session.get(User, 'c'))
+
+            # new objects replace missing ones
+            c = User(id='c', name='C')
+            session.add(c)
+            self.assertIs(session.get(User, 'c'), c)
+            with self.assertRaises(ValueError):
+                session.add(User(id='a'))
+        self.assertEqual(User.load(self.redis, 'c').name, 'C')
+
+    def test_partial_prefetch(self):
+        with Session(self.redis) as session:
+            a = session.get(User, 'a', User.name)
+            a.name = 'changed'
+            self.assertIsNone(a.visits)
+            self.assertIs(session.get(User, 'a'), a)
+            self.assertEqual((a.name, a.visits, a.tags), ('changed', 1, ['x']))
+
+    def test_flush(self):
+        with Session(self.redis) as session:
+            a = session.get(User, 'a')
+            a.visits = 10
+            session.add(a)
+            a.visits = 11
+            session.add(a, User.name)
+            session.add(Post(id='p', user='a', title='title'))
+            session.delete(session.get(User, 'b'))
+            # nothing is written until the session is flushed
+            self.assertFalse(self.redis.exists(Post.key('p')))
+        self.assertEqual(self.redis.hgetall(User.key('a')), {b'id': b'a', b'name': b'A', b'visits': b'11'})
+        self.assertEqual(Post.load(self.redis, 'p').title, 'title')
+        self.assertFalse(self.redis.exists(User.key('b')))
+        self.assertEqual(User.find_ids(self.redis, visits=11), ['a'])
+        self.assertEqual(User.find_ids(self.redis, visits=2), [])
+
+    def test_discard(self):
+        with self.assertRaises(ValueError):
+            with Session(self.redis) as session:
+                session.add(Post(id='p', title='title'))
+                raise ValueError()
+        self.assertFalse(self.redis.exists(Post.key('p')))
+
+        with self.assertRaises(ValueError):
+            with Session(self.redis) as session:
+                session.add(Post(id='p', title='title'))
+                session.add(User(id='c', visits='invalid'))
+        self.assertFalse(self.redis.exists(Post.key('p')))
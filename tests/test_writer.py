@@ -0,0 +1,108 @@
+import unittest
+from threading import Thread
+from redis_mock import Redis
+from redistil import *
+
+class Telemetry(Model):
+    id = Field(String, primary_key=True)
+    version = Field(Integer, version=True)
+    value = Field(Integer, index=True)
+    label = Field(String)
+    samples = List(Integer)
+
+class CachedTelemetry(Model):
+    id = Field(String, primary_key=True)
+    value = Field(Integer)
+
+    class Meta:
+        cache = ObjectCache()
+
+class TestWriteBehind(unittest.TestCase):
+    def setUp(self):
+        self.redis = Redis()
+
+    def tearDown(self):
+        self.redis.flushall()
+
+    def test_coalesce(self):
+        counts = []
+        execute = PromisePipeline.execute
+        def counted(p):
+            counts.append(p.commands)
+            return execute(p)
+        with WriteBehind(self.redis, interval=60) as writer:
+            objs = [Telemetry(id=str(i), value=0, label='a', samples=[1]) for i in range(10)]
+            for obj in objs:
+                writer.save(obj)
+            writer.flush()
+            PromisePipeline.execute = counted
+            try:
+                def update(obj):
+                    for value in range(1, 101):
+                        obj.value = value
+                        writer.save(obj)
+                threads = [Thread(target=update, args=(obj,)) for obj in objs]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                writer.flush()
+            finally:
+                PromisePipeline.execute = execute
+        # a single transaction for 1000 saves
+        self.assertEqual(len(counts), 1)
+        self.assertEqual(Telemetry.load(self.redis, '3').value, 100)
+        self.assertEqual(Telemetry.load(self.redis, '3').version, 2)
+        self.assertEqual(Telemetry.find_ids(self.redis, value=100), [str(i) for i in range(10)])
+        self.assertEqual(Telemetry.find_ids(self.redis, value=0), [])
+        self.assertEqual(objs[0].dirty_fields, set())
+
+    def test_unloaded_index(self):
+        Telemetry.create(self.redis, id='a', value=1)
+        writer = WriteBehind(self.redis, interval=60)
+        obj = Telemetry(id='a', value=2)
+        writer.save(obj, Telemetry.value)
+        obj.value = 3
+        writer.save(obj, Telemetry.value)
+        writer.close()
+        self.assertEqual(Telemetry.find_ids(self.redis, value=1), [])
+        self.assertEqual(Telemetry.find_ids(self.redis, value=3), ['a'])
+        with self.assertRaises(RuntimeError):
+            writer.save(obj, Telemetry.value)
+
+    def test_cache(self):
+        obj = CachedTelemetry.create(self.redis, id='a', value=1)
+        self.assertEqual(CachedTelemetry.load(self.redis, 'a').value, 1)
+        with WriteBehind(self.redis, interval=60) as writer:
+            obj.value = 5
+            writer.save(obj)
+            # buffered saves are only visible once written
+            self.assertEqual(CachedTelemetry.load(self.redis, 'a').value, 1)
+            writer.flush()
+            self.assertEqual(CachedTelemetry.load(self.redis, 'a').value, 5)
+
+    def test_thresholds(self):
+        writer = WriteBehind(self.redis, interval=60, batch_size=5, max_pending=5)
+        for i in range(20):
+            writer.save(Telemetry(id=str(i), value=i))
+        writer.close()
+        self.assertEqual(len(list(Telemetry.iter_ids(self.redis))), 20)
+
+        writer = WriteBehind(self.redis, interval=0.01)
+        writer.save(Telemetry(id='timed', value=1))
+        writer.thread.join(0.5)
+        self.assertTrue(self.redis.exists(Telemetry.key('timed')))
+        writer.close()
+
+    def test_error(self):
+        writer = WriteBehind(self.redis, interval=60)
+        writer.save(Telemetry(id='a', value=1))
+        self.redis.set(Telemetry.key('a'), 'not a hash')
+        with self.assertRaises(Exception):
+            writer.flush()
+        # the writer keeps running
+        writer.save(Telemetry(id='b', value=1))
+        writer.close()
+        self.assertTrue(self.redis.exists(Telemetry.key('b')))
+        with self.assertRaises(ValueError):
+            WriteBehind(self.redis).save(Telemetry(id='c', value='invalid'))